@@ -0,0 +1,80 @@
+"""
+checks that importing the application stays fast: every module is imported in a fresh interpreter
+several times and the fastest import has to fit into its budget. Modules that should be imported only
+on first use (numpy, saving of measurements) mustn't be loaded by the import and no adapter may be created.
+Exits with 1 if a check fails, run from the root folder: python scripts/check_startup_time.py
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+# module: (budget in ms, modules it mustn't load)
+BUDGETS = {
+    "backend.command": (60, ["numpy", "backend.measurement", "backend.storage"]),
+    "frontend.gui": (400, ["numpy", "backend.measurement", "backend.storage"]),
+}
+CHILD = """
+import json, sys, time
+sys.path.insert(0, {src!r})
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+command = sys.modules.get("backend.command")
+print(json.dumps({{
+    "ms": elapsed * 1000,
+    "loaded": [name for name in {forbidden!r} if name in sys.modules],
+    "adapter_created": command is not None and command.adapter is not None,
+}}))
+"""
+
+
+def measure(module, forbidden, repeat):
+    """
+    returns results of importing the module in repeat fresh interpreters, the fastest first
+    """
+    results = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, "-c", CHILD.format(src=SRC, module=module, forbidden=forbidden)],
+            capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"importing {module} failed:\n{completed.stderr}")
+        results.append(json.loads(completed.stdout.splitlines()[-1]))
+    return sorted(results, key=lambda result: result["ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5, help="imports of every module, the fastest counts")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies all budgets (slow machines)")
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS), help="modules to check")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        budget, forbidden = BUDGETS[module]
+        budget *= args.scale
+        try:
+            result = measure(module, forbidden, args.repeat)[0]
+        except RuntimeError as error:
+            print(error)
+            failed = True
+            continue
+        problems = []
+        if result["ms"] > budget:
+            problems.append(f"over budget of {budget:.0f} ms")
+        if result["loaded"]:
+            problems.append(f"loaded {', '.join(result['loaded'])}")
+        if result["adapter_created"]:
+            problems.append("created the adapter")
+        print(f"{module}: {result['ms']:.1f} ms {'FAILED: ' + '; '.join(problems) if problems else 'ok'}")
+        failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
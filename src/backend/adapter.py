@@ -1,23 +1,200 @@
 import time
 import subprocess
 import threading
-import queue
 import platform
 import os
+from collections import deque
+from backend.metrics import Metrics
 
 
 class AdapterError(Exception):
     pass
 
 
-class Adapter:
+class OutputBuffer:
+    """
+    output of hpctrl read from the pipe in chunks. Complete lines are appended to one byte buffer that
+    consumers take whole responses from (decoded once, not line by line), binary blocks
+    (#<number of digits><length><bytes>) are kept as bytes and '!not ready' lines only set self.not_ready
+    """
+    block_start = b"#"
+
+    def __init__(self, msg_not_ready):
+        self.msg_not_ready = msg_not_ready.encode()
+        self.not_ready = threading.Event()
+        # perf_counter time of the last '!not ready' and the number of them so far
+        self.not_ready_at = 0.0
+        self.rejections = 0
+        # bytes not parsed yet (an incomplete line or block)
+        self.pending = bytearray()
+        self.text = bytearray()
+        self.blocks = deque()
+        # monotonic time of the last text
+        self.text_at = 0.0
+        # a block may be followed by a newline which isn't part of the text
+        self.after_block = False
+        self.closed = False
+        self.changed = threading.Condition()
+
+    def feed(self, chunk):
+        with self.changed:
+            self.pending += chunk
+            self.parse()
+            self.changed.notify_all()
+
+    def close(self):
+        with self.changed:
+            self.closed = True
+            self.changed.notify_all()
+
+    def parse(self):
+        pending = self.pending
+        pos = 0
+        text_start = len(self.text)
+        while pos < len(pending):
+            if self.after_block:
+                self.after_block = False
+                if pending[pos] == ord("\n"):
+                    pos += 1
+                    continue
+            if pending.startswith(self.block_start, pos):
+                end = self.parse_block(pos)
+                if end is None:
+                    break
+                if end > pos:
+                    pos = end
+                    continue
+            elif pending.startswith(self.msg_not_ready, pos):
+                end = pending.find(b"\n", pos)
+                if end < 0:
+                    break
+                self.not_ready_at = time.perf_counter()
+                self.rejections += 1
+                self.not_ready.set()
+                pos = end + 1
+                continue
+            end = self.text_end(pos)
+            if end <= pos:
+                break
+            self.text += pending[pos:end]
+            pos = end
+        del pending[:pos]
+        if len(self.text) > text_start:
+            self.text_at = time.monotonic()
+
+    def text_end(self, pos):
+        """
+        returns the end of complete lines from pos up to the next line that may be a block or not ready
+        """
+        ends = [i + 1 for i in (self.pending.find(b"\n#", pos), self.pending.find(b"\n!", pos)) if i >= 0]
+        return min(ends) if ends else self.pending.rfind(b"\n", pos) + 1
+
+    def parse_block(self, pos):
+        """
+        returns the end of the block starting at pos, pos if it's not a block or None if it's incomplete
+        """
+        pending = self.pending
+        if len(pending) < pos + 2:
+            return None
+        digits = pending[pos + 1:pos + 2]
+        if not digits.isdigit():
+            return pos
+        start = pos + 2 + int(digits)
+        if len(pending) < start:
+            return None
+        length = pending[pos + 2:start]
+        if not length.isdigit():
+            return pos
+        end = start + int(length)
+        if len(pending) < end:
+            return None
+        self.blocks.append(bytes(pending[start:end]))
+        self.after_block = True
+        return end
+
+    def response_end(self, lines, terminator):
+        """
+        returns the end of a framed response in self.text or None if it isn't complete yet
+        """
+        ends = []
+        if lines is not None:
+            end = 0
+            for _ in range(lines):
+                end = self.text.find(b"\n", end) + 1
+                if not end:
+                    break
+            else:
+                ends.append(end)
+        if terminator is not None:
+            found = self.text.find(terminator.encode())
+            if found >= 0:
+                ends.append(self.text.find(b"\n", found) + 1)
+        return min(ends) if ends else None
+
+    def take(self, timeout, lines=None, terminator=None, idle=0.0, until_not_ready=False):
+        """
+        removes a response from the text and returns it with the perf_counter time its first line was seen,
+        returns (None, time) if it isn't complete in timeout seconds (or when '!not ready' comes if
+        until_not_ready is True). See Adapter.get_output for framing
+        """
+        framed = lines is not None or terminator is not None
+        deadline = time.monotonic() + timeout
+        first_line_at = None
+        with self.changed:
+            while True:
+                now = time.monotonic()
+                if self.text:
+                    if first_line_at is None:
+                        first_line_at = time.perf_counter()
+                    end = self.response_end(lines, terminator) if framed else None
+                    if not framed and now - self.text_at >= idle:
+                        end = len(self.text)
+                    if end is not None:
+                        response = bytes(self.text[:end])
+                        del self.text[:end]
+                        return response, first_line_at
+                if now >= deadline or self.closed or until_not_ready and self.not_ready.is_set():
+                    return None, first_line_at
+                wait = deadline - now
+                if self.text and not framed:
+                    wait = min(wait, self.text_at + idle - now)
+                self.changed.wait(wait)
+
+    def take_block(self, timeout, until_not_ready=False):
+        """
+        removes and returns the next binary block or None if there's none in timeout seconds, see take
+        """
+        deadline = time.monotonic() + timeout
+        with self.changed:
+            while not self.blocks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self.closed or until_not_ready and self.not_ready.is_set():
+                    return None
+                self.changed.wait(remaining)
+            return self.blocks.popleft()
+
+    def put_back(self, output):
+        with self.changed:
+            if not output.endswith(b"\n"):
+                output += b"\n"
+            self.text[:0] = output
+            self.changed.notify_all()
+
+    def clear(self):
+        with self.changed:
+            self.text.clear()
+            self.blocks.clear()
+
+
+class AdapterBase:
+    """
+    what Adapter and AsyncAdapter share: hpctrl's commands, framing of its output (OutputBuffer), handling of
+    '!not ready' and metrics. Subclasses start hpctrl, write to it and wait for the output
+    """
     address: int
-    out_queue: queue.Queue = None
+    output: "OutputBuffer" = None
     connected: bool = False
     in_cmd_mode: bool = False
-    process: subprocess.Popen = None
-    out_thread: threading.Thread = None
-    out_thread_killed: bool = False
     testing: bool = False
     hpctrl_executable: str
     cmd_leave_cmd: str = "."
@@ -29,6 +206,37 @@ class Adapter:
     cmd_exit: str = "exit"
     cmd_idn: str = "q *IDN?"
     cmd_idn_response: str = "HEWLETT-PACKARD,83480A,US35240110,07.12"
+    query_prefix: str = "q "
+    batch_verb: str = "batch"
+    block_start: bytes = b"#"
+    # bytes read from the pipe at once
+    chunk_size: int = 1 << 16
+    # seconds without output after which a response without explicit framing is complete
+    idle_gap: float = 0.01
+    msg_not_ready: str = "!not ready"
+    not_ready: threading.Event = None
+    # seconds to wait after a set command for hpctrl to reject it (OSCI_READY_TIMEOUT in ms), a query doesn't
+    # wait, its answer shows it was accepted. A rejection coming later is still matched (see settle) and doubles
+    # the wait up to max_ready_timeout, the fixed delay between commands used to be 100 ms. With OSCI_METRICS
+    # on, the '!not ready' row shows how late rejections come on the actual hpctrl and machine
+    ready_timeout: float = 0.005
+    max_ready_timeout: float = 0.1
+    # seconds after which a written message is considered accepted if no answer showed it sooner
+    rejection_timeout: float = 1.0
+    # the first pause before sending a rejected command again
+    retry_backoff: float = 0.005
+    max_retry_backoff: float = 0.2
+    max_retries: int = 12
+    # command timings, None if they aren't collected (see OSCI_METRICS)
+    metrics: Metrics = None
+    # verb and time of the last accepted write, output is attributed to it
+    last_sent: tuple = None
+    # written messages hpctrl may still reject, (message, perf_counter write time) in the order of writing
+    unconfirmed: list = None
+    # number of '!not ready' lines matched to messages
+    matched_rejections: int = 0
+    # the message whose answer get_output or get_block reads next, it's sent again if it's rejected
+    awaited: str = None
 
     def __init__(self, testing):
         self.hpctrl_executable = os.path.join(os.getenv("OSCI_HPCTRL_DIR"), "hpctrl")
@@ -42,51 +250,179 @@ class Adapter:
         if not os.path.isfile(self.hpctrl_executable):
             raise AdapterError(f"HPCTRL not found in {self.hpctrl_executable}")
 
+        if os.getenv("OSCI_METRICS") == "true":
+            self.metrics = Metrics()
+
+        ready_timeout = os.getenv("OSCI_READY_TIMEOUT")
+        if ready_timeout:
+            if not ready_timeout.isdigit():
+                raise AdapterError(f"OSCI_READY_TIMEOUT '{ready_timeout}' is not a number of milliseconds")
+            self.ready_timeout = int(ready_timeout) / 1000
+
+    def response(self, output, first_line_at, raw):
+        """
+        returns a response taken from self.output as str (bytes if raw is True) and records it into self.metrics
+        """
+        if self.metrics is not None:
+            self.record_output(len(output), first_line_at)
+        res = output.strip() if raw else output.decode(errors="replace").replace("\r\n", "\n").strip()
+        if not res:
+            raise AdapterError("got empty string as response from hpctrl")
+        return res
+
+    def put_back(self, output):
+        """
+        returns output (str) in front of the output from hpctrl, so the next get_output gets it again
+        """
+        self.output.put_back(output.encode())
+
+    def record_output(self, size, first_line_at=None):
+        """
+        records the response to the last sent command into self.metrics, only the first response is counted
+        """
+        if self.last_sent is None:
+            return
+        verb, sent_at = self.last_sent
+        first_line = None if first_line_at is None else first_line_at - sent_at
+        self.metrics.record(verb, first_line=first_line, total=time.perf_counter() - sent_at, bytes=size)
+        self.last_sent = None
+
+    def settle(self):
+        """
+        matches the '!not ready' lines that came since the last call to the newest unconfirmed messages and returns
+        the rejected ones in the order they were written. hpctrl is busy right after it accepts a message, so of
+        messages written shortly one after another the later ones are rejected. Messages older than
+        self.rejection_timeout are considered accepted
+        """
+        self.not_ready.clear()
+        rejections = self.output.rejections - self.matched_rejections
+        self.matched_rejections += rejections
+        if rejections > len(self.unconfirmed):
+            self.unconfirmed = []
+            raise AdapterError("hpctrl rejected a command that can't be told anymore, it wasn't sent again")
+        now = time.perf_counter()
+        if rejections and self.output.not_ready_at - self.unconfirmed[-1][1] > self.ready_timeout:
+            # late, messages written since may have been taken for accepted
+            self.ready_timeout = min(2 * self.ready_timeout, self.max_ready_timeout)
+        rejected = self.unconfirmed[len(self.unconfirmed) - rejections:]
+        del self.unconfirmed[len(self.unconfirmed) - rejections:]
+        self.unconfirmed = [(message, at) for message, at in self.unconfirmed if now - at < self.rejection_timeout]
+        if self.metrics is not None:
+            for _, written_at in rejected:
+                self.metrics.record(self.msg_not_ready, first_line=self.output.not_ready_at - written_at)
+        return [message for message, _ in rejected]
+
+    def answered(self):
+        """
+        called when the answer to self.awaited came. It was accepted, so '!not ready' lines before the answer
+        belong to messages written before it, which are returned (see settle) except for earlier copies of
+        the awaited message. The others were accepted
+        """
+        awaited = self.awaited
+        for i in reversed(range(len(self.unconfirmed))):
+            if self.unconfirmed[i][0] == awaited:
+                del self.unconfirmed[i]
+                break
+        self.awaited = None
+        rejected = [message for message in self.settle() if message != awaited]
+        self.unconfirmed = []
+        return rejected
+
+    def batch_settled(self):
+        """
+        called when rejections of a batch were handled by the batch, they aren't matched to single messages
+        """
+        self.not_ready.clear()
+        self.unconfirmed = []
+        self.matched_rejections = self.output.rejections
+
+    def count_attempt(self, attempts, message):
+        """
+        counts a rejection of the message in attempts, raises AdapterError if it was rejected too many times
+        """
+        attempts[message] = attempts.get(message, 0) + 1
+        if attempts[message] > self.max_retries:
+            raise AdapterError(f"hpctrl is not ready, '{message}' was rejected {attempts[message]} times")
+
+    def record_write(self, message, started, written_at):
+        """
+        records the time to write the message (with retries) into self.metrics, its output is measured
+        from written_at
+        """
+        verb = Metrics.verb(message)
+        self.metrics.record(verb, write=time.perf_counter() - started)
+        self.last_sent = (verb, written_at)
+
+    def clear_input_queue(self):
+        """
+        clears output and blocks from hpctrl that weren't taken yet
+        """
+        self.output.clear()
+
+    def new_output(self):
+        """
+        creates the buffer for the output of a newly started hpctrl
+        """
+        self.output = OutputBuffer(self.msg_not_ready)
+        self.not_ready = self.output.not_ready
+        self.unconfirmed = []
+        self.matched_rejections = 0
+        self.awaited = None
+
+    def count_queries(self, messages):
+        return sum(message.startswith(self.query_prefix) for message in messages)
+
+
+class Adapter(AdapterBase):
+    process: subprocess.Popen = None
+    out_thread: threading.Thread = None
+    out_thread_killed: bool = False
+
     def enqueue_output(self):
         """
-        reads what hpctrl is saying on stdout into self.out_queue line by line
+        reads what hpctrl is saying on stdout in chunks of up to self.chunk_size bytes into self.output
         """
         out = self.process.stdout
-        for line in iter(out.readline, b""):
-            if self.out_thread_killed:
+        while True:
+            chunk = out.read1(self.chunk_size)
+            if self.out_thread_killed or not chunk:
                 out.close()
+                self.output.close()
                 return
-            if line:
-                self.out_queue.put(line)
-            else:
-                time.sleep(0.001)
+            self.output.feed(chunk)
 
-    def get_output(self, timeout):
+    def get_output(self, timeout, lines=None, terminator=None, idle=None, raw=False):
         """
-        returns output from hpctrl as str. Timeout arg is in seconds.
+        returns output from hpctrl as str (bytes if raw is True). Timeout arg is in seconds. The response ends
+        after the number of lines, after a line containing terminator or, if neither is given, when hpctrl
+        doesn't print anything for idle seconds (self.idle_gap by default)
         """
-        out_str = ""
-        get_started = time.time()
-        time.sleep(0.1)
+        idle = self.idle_gap if idle is None else idle
+        deadline = time.monotonic() + timeout
         while True:
-            if self.out_queue.empty():
-                number_of_attempts = 10
-                while self.out_queue.empty() and number_of_attempts > 0:
-                    time.sleep(0.0001)
-                    number_of_attempts -= 1
-            if out_str and self.out_queue.empty():
-                break
-            if time.time() > get_started + timeout:
+            output, first_line_at = self.output.take(max(deadline - time.monotonic(), 0), lines, terminator, idle,
+                                                     until_not_ready=True)
+            if not self.resend_rejected(output is not None) and output is not None:
+                return self.response(output, first_line_at, raw)
+            if time.monotonic() >= deadline or self.output.closed:
+                self.awaited = None
                 raise AdapterError(f"timeout error: the operation took longer than {timeout} seconds")
-            if not self.out_queue.empty():
-                out_str += self.out_queue.get_nowait()
-
-        res = out_str.strip()
-        if not res:
-            raise AdapterError("got empty string as response from hpctrl")
-        return res
 
-    def clear_input_queue(self):
+    def get_block(self, timeout):
         """
-        clears self.out_queue
+        returns the next binary block from hpctrl as bytes. Timeout arg is in seconds.
         """
-        while not self.out_queue.empty():
-            self.out_queue.get_nowait()
+        deadline = time.monotonic() + timeout
+        while True:
+            block = self.output.take_block(max(deadline - time.monotonic(), 0), until_not_ready=True)
+            if not self.resend_rejected(block is not None) and block is not None:
+                break
+            if time.monotonic() >= deadline or self.output.closed:
+                self.awaited = None
+                raise AdapterError(f"timeout error: no data block in {timeout} seconds")
+        if self.metrics is not None:
+            self.record_output(len(block))
+        return block
 
     def start_hpctrl(self):
         """
@@ -100,11 +436,10 @@ class Adapter:
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            universal_newlines=True,
             creationflags=0x08000000 if platform.system() == "Windows" else 0
         )
 
-        self.out_queue = queue.Queue()
+        self.new_output()
 
         self.out_thread = threading.Thread(target=self.enqueue_output)
         self.out_thread.daemon = True
@@ -127,7 +462,7 @@ class Adapter:
                 self.process.terminate()
                 self.process.kill()
                 self.process = None
-        self.out_queue = None
+        self.output = None
 
     def restart_hpctrl(self):
         """
@@ -138,39 +473,157 @@ class Adapter:
 
     def is_hpctrl_running(self):
         """returns True if hpctrl is running"""
-        return all([self.process, self.out_thread, self.out_queue])
+        return all([self.process, self.out_thread, self.output])
 
     def is_osci_responsive(self):
         """
         returns True if oscilloscope responds "HEWLETT-PACKARD,83480A,US35240110,07.12" to "q *IDN?" command
         """
-        return self.send_and_get_output([self.cmd_idn], 0.2) == self.cmd_idn_response
+        return self.send_and_get_output([self.cmd_idn], 0.2, lines=1) == self.cmd_idn_response
 
-    def send(self, messages):
+    def send(self, messages, awaited=False):
         """
-        clears input queue an then prints messages into self.process.stdin
+        clears input queue an then prints messages into self.process.stdin one by one. A message hpctrl
+        rejects ('!not ready') is sent again after a growing pause, also if the rejection comes late (see
+        AdapterBase.settle). If awaited is True, the answer to the last message is read next by get_output
+        or get_block, so it's written without waiting for a rejection, the answer shows it was accepted
         """
         self.clear_input_queue()
 
         if not self.is_hpctrl_running():
             raise AdapterError("hpctrl is not running")
-        if isinstance(messages, list):
-            messages = "\n".join(messages)
+        if not isinstance(messages, list):
+            messages = messages.split("\n")
         try:
-            print(messages, file=self.process.stdin)
-            self.process.stdin.flush()
-            # TODO toto bolo pri hpctrl zmenene tak otestovat ci funguje bez sleep
-            time.sleep(0.1)  # aby HPCTRL stihol spracovat prikaz, inak vypisuje !not ready, try again later (ping)
+            self.send_until_ready(messages, messages[-1] if awaited and messages else None)
         except OSError:
-            if messages != self.cmd_exit:
+            if messages != [self.cmd_exit]:
                 raise AdapterError("could not send the command")
 
-    def send_and_get_output(self, messages, timeout):
+    def send_until_ready(self, messages, awaited=None):
+        """
+        writes the messages one by one and sends again the rejected ones (also messages written before, see
+        settle) after a growing pause. Waits self.ready_timeout after a message for its rejection, except for
+        the awaited one if it's written last, get_output or get_block wait for its answer
+        """
+        pending = deque(messages)
+        attempts = {}
+        started = {}
+        backoff = self.retry_backoff
+        while pending or self.not_ready.is_set():
+            if self.not_ready.is_set():
+                rejected = self.settle()
+                for message in rejected:
+                    self.count_attempt(attempts, message)
+                pending.extendleft(reversed(rejected))
+                if rejected:
+                    time.sleep(backoff)
+                    backoff = min(2 * backoff, self.max_retry_backoff)
+                continue
+            message = pending.popleft()
+            written_at = time.perf_counter()
+            self.process.stdin.write(f"{message}\n".encode())
+            self.process.stdin.flush()
+            self.unconfirmed.append((message, written_at))
+            if self.metrics is not None:
+                started.setdefault(message, written_at)
+            if message == awaited and not pending:
+                self.awaited = message
+            elif self.not_ready.wait(self.ready_timeout):
+                continue
+            else:
+                backoff = self.retry_backoff
+            if self.metrics is not None:
+                self.record_write(message, started[message], written_at)
+
+    def resend_rejected(self, answered):
+        """
+        sends again messages hpctrl rejected while get_output or get_block waited for the answer to
+        self.awaited, returns True if the answer has to be read again. If the answer came (answered is True),
+        only messages written before the awaited one can have been rejected, the awaited one is sent again
+        after them, so its answer doesn't precede them
+        """
+        awaited = self.awaited
+        if answered:
+            if awaited is None:
+                return False
+            rejected = self.answered()
+            if not rejected:
+                return False
+            time.sleep(self.retry_backoff)
+            self.send_until_ready(rejected + [awaited], awaited)
+            return True
+        if not self.not_ready.is_set():
+            return False
+        self.send_until_ready([], awaited)
+        return True
+
+    def send_batch(self, messages, timeout):
+        """
+        writes all messages into self.process.stdin at once and returns a list of answers to the queries
+        (messages starting with "q "), each query is answered with one line. If hpctrl rejects any message
+        of the batch, the whole batch is sent again one message at a time
+        """
+        if not self.is_hpctrl_running():
+            raise AdapterError("hpctrl is not running")
+        self.clear_input_queue()
+        try:
+            self.send_until_ready([])
+            started = time.perf_counter() if self.metrics is not None else None
+            self.process.stdin.write("".join(f"{message}\n" for message in messages).encode())
+            self.process.stdin.flush()
+        except OSError:
+            raise AdapterError("could not send the commands")
+        if started is not None:
+            self.record_write(self.batch_verb, started, started)
+
+        number_of_queries = self.count_queries(messages)
+        answers = []
+        deadline = time.monotonic() + timeout
+        while len(answers) < number_of_queries and not self.not_ready.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise AdapterError(f"timeout error: the operation took longer than {timeout} seconds")
+            answer, _ = self.output.take(min(remaining, self.ready_timeout), lines=1)
+            if answer is not None:
+                answers.append(answer.decode(errors="replace").strip())
+        if not self.not_ready.wait(self.ready_timeout):
+            self.batch_settled()
+            if started is not None:
+                self.record_output(sum(len(answer) for answer in answers))
+            return answers
+
+        self.wait_for_silence(self.max_retry_backoff)
+        self.batch_settled()
+        answers = []
+        for message in messages:
+            if message.startswith(self.query_prefix):
+                answers.append(self.send_and_get_output([message], timeout, lines=1))
+            else:
+                self.send([message])
+        return answers
+
+    def wait_for_silence(self, gap):
+        """
+        waits until hpctrl doesn't print anything for gap seconds, so late answers aren't mistaken
+        for answers to the next command
+        """
+        while self.output.take(gap, lines=1)[0] is not None:
+            pass
+
+    def send_and_get_output(self, messages, timeout, lines=None, terminator=None, idle=None, raw=False):
+        """
+        calls self.send(messages) and then self.get_output(timeout, lines, terminator, idle, raw)
+        """
+        self.send(messages, awaited=True)
+        return self.get_output(timeout, lines, terminator, idle, raw)
+
+    def send_and_get_block(self, messages, timeout):
         """
-        calls self.send(messages) and then self.get_output(timeout, lines)
+        calls self.send(messages) and then self.get_block(timeout)
         """
-        self.send(messages)
-        return self.get_output(timeout)
+        self.send(messages, awaited=True)
+        return self.get_block(timeout)
 
     def connect(self, address):
         """
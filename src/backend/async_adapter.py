@@ -0,0 +1,376 @@
+import asyncio
+import platform
+import threading
+import time
+from collections import deque
+from backend.adapter import AdapterBase, AdapterError
+
+
+class AsyncAdapter(AdapterBase):
+    """
+    adapter for asyncio code: hpctrl runs as an asyncio subprocess and its stdout is read by a task of the
+    event loop instead of a thread, so waiting for output or for hpctrl to be ready doesn't block the loop.
+    The output is parsed by the same OutputBuffer as in Adapter (framing, blocks, '!not ready') and metrics
+    are recorded the same way, methods talking to hpctrl are coroutines. All of them have to run on one loop
+    """
+    process: asyncio.subprocess.Process = None
+    reader_task: asyncio.Task = None
+    # set by the reader task after every chunk of output, waits check self.output again when it's set
+    fed: asyncio.Event = None
+    # seconds to wait for hpctrl to exit after the exit command
+    exit_timeout: float = 1
+
+    async def enqueue_output(self):
+        """
+        reads what hpctrl is saying on stdout in chunks of up to self.chunk_size bytes into self.output
+        """
+        try:
+            while True:
+                chunk = await self.process.stdout.read(self.chunk_size)
+                if not chunk:
+                    return
+                self.output.feed(chunk)
+                self.fed.set()
+        finally:
+            self.output.close()
+            self.fed.set()
+
+    async def wait_for(self, check, timeout, poll=None):
+        """
+        calls check whenever hpctrl prints something (at least every poll seconds if given) until it returns
+        something else than None and returns it, returns None after timeout seconds
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            self.fed.clear()
+            result = check()
+            if result is not None:
+                return result
+            remaining = deadline - loop.time()
+            if remaining <= 0 or self.output.closed:
+                return None
+            try:
+                await asyncio.wait_for(self.fed.wait(), remaining if poll is None else min(remaining, poll))
+            except asyncio.TimeoutError:
+                pass
+
+    async def get_output(self, timeout, lines=None, terminator=None, idle=None, raw=False):
+        """
+        returns output from hpctrl as str (bytes if raw is True), see Adapter.get_output
+        """
+        idle = self.idle_gap if idle is None else idle
+        first_line_at = None
+
+        def take():
+            nonlocal first_line_at
+            output, seen_at = self.output.take(0, lines, terminator, idle)
+            first_line_at = first_line_at or seen_at
+            return output if output is not None or not self.not_ready.is_set() else b""
+
+        framed = lines is not None or terminator is not None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            output = await self.wait_for(take, max(deadline - loop.time(), 0), None if framed else idle)
+            if not output:
+                output = None
+            if not await self.resend_rejected(output is not None) and output is not None:
+                return self.response(output, first_line_at, raw)
+            if loop.time() >= deadline or self.output.closed:
+                self.awaited = None
+                raise AdapterError(f"timeout error: the operation took longer than {timeout} seconds")
+
+    async def get_block(self, timeout):
+        """
+        returns the next binary block from hpctrl as bytes. Timeout arg is in seconds.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            block = await self.wait_for(
+                lambda: self.output.take_block(0) or (b"" if self.not_ready.is_set() else None),
+                max(deadline - loop.time(), 0)
+            )
+            if not block:
+                block = None
+            if not await self.resend_rejected(block is not None) and block is not None:
+                break
+            if loop.time() >= deadline or self.output.closed:
+                self.awaited = None
+                raise AdapterError(f"timeout error: no data block in {timeout} seconds")
+        if self.metrics is not None:
+            self.record_output(len(block))
+        return block
+
+    async def wait_until_not_ready(self, timeout):
+        """
+        returns True if hpctrl answered that it's not ready within timeout seconds
+        """
+        return await self.wait_for(lambda: self.not_ready.is_set() or None, timeout) is not None
+
+    async def start_hpctrl(self):
+        """
+        starts hpctrl with the -i flag
+        """
+        if self.is_hpctrl_running():
+            return
+
+        self.process = await asyncio.create_subprocess_exec(
+            self.hpctrl_executable, "-i",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            creationflags=0x08000000 if platform.system() == "Windows" else 0
+        )
+
+        self.new_output()
+        self.fed = asyncio.Event()
+        self.reader_task = asyncio.create_task(self.enqueue_output())
+
+    async def kill_hpctrl(self):
+        """
+        sends exit command to hpctrl or kills it if it's frozen
+        """
+        self.in_cmd_mode = False
+        if self.process is not None:
+            await self.send([self.cmd_exit])
+            try:
+                await asyncio.wait_for(self.process.wait(), self.exit_timeout)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+            self.process = None
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+            await asyncio.gather(self.reader_task, return_exceptions=True)
+            self.reader_task = None
+        self.output = None
+
+    async def restart_hpctrl(self):
+        """
+        calls self.kill_hpctrl() and then self.start_hpctrl()
+        """
+        await self.kill_hpctrl()
+        await self.start_hpctrl()
+
+    def is_hpctrl_running(self):
+        """returns True if hpctrl is running"""
+        return all([self.process, self.reader_task, self.output])
+
+    async def is_osci_responsive(self):
+        """
+        returns True if oscilloscope responds "HEWLETT-PACKARD,83480A,US35240110,07.12" to "q *IDN?" command
+        """
+        return await self.query(self.cmd_idn, 0.2) == self.cmd_idn_response
+
+    async def write(self, data):
+        self.process.stdin.write(data)
+        await self.process.stdin.drain()
+
+    async def send(self, messages, awaited=False):
+        """
+        clears input queue an then prints messages into hpctrl's stdin one by one, see Adapter.send
+        """
+        self.clear_input_queue()
+
+        if not self.is_hpctrl_running():
+            raise AdapterError("hpctrl is not running")
+        if not isinstance(messages, list):
+            messages = messages.split("\n")
+        try:
+            await self.send_until_ready(messages, messages[-1] if awaited and messages else None)
+        except OSError:
+            if messages != [self.cmd_exit]:
+                raise AdapterError("could not send the command")
+
+    async def send_until_ready(self, messages, awaited=None):
+        """
+        see Adapter.send_until_ready
+        """
+        pending = deque(messages)
+        attempts = {}
+        started = {}
+        backoff = self.retry_backoff
+        while pending or self.not_ready.is_set():
+            if self.not_ready.is_set():
+                rejected = self.settle()
+                for message in rejected:
+                    self.count_attempt(attempts, message)
+                pending.extendleft(reversed(rejected))
+                if rejected:
+                    await asyncio.sleep(backoff)
+                    backoff = min(2 * backoff, self.max_retry_backoff)
+                continue
+            message = pending.popleft()
+            written_at = time.perf_counter()
+            await self.write(f"{message}\n".encode())
+            self.unconfirmed.append((message, written_at))
+            if self.metrics is not None:
+                started.setdefault(message, written_at)
+            if message == awaited and not pending:
+                self.awaited = message
+            elif await self.wait_until_not_ready(self.ready_timeout):
+                continue
+            else:
+                backoff = self.retry_backoff
+            if self.metrics is not None:
+                self.record_write(message, started[message], written_at)
+
+    async def resend_rejected(self, answered):
+        """
+        see Adapter.resend_rejected
+        """
+        awaited = self.awaited
+        if answered:
+            if awaited is None:
+                return False
+            rejected = self.answered()
+            if not rejected:
+                return False
+            await asyncio.sleep(self.retry_backoff)
+            await self.send_until_ready(rejected + [awaited], awaited)
+            return True
+        if not self.not_ready.is_set():
+            return False
+        await self.send_until_ready([], awaited)
+        return True
+
+    async def query(self, message, timeout=5, lines=1, terminator=None, idle=None, raw=False):
+        """
+        sends one message and returns the response, one line by default, see Adapter.get_output
+        """
+        await self.send([message], awaited=True)
+        return await self.get_output(timeout, lines, terminator, idle, raw)
+
+    async def send_batch(self, messages, timeout):
+        """
+        writes all messages at once and returns a list of answers to the queries, see Adapter.send_batch
+        """
+        if not self.is_hpctrl_running():
+            raise AdapterError("hpctrl is not running")
+        self.clear_input_queue()
+        try:
+            await self.send_until_ready([])
+            started = time.perf_counter() if self.metrics is not None else None
+            await self.write("".join(f"{message}\n" for message in messages).encode())
+        except OSError:
+            raise AdapterError("could not send the commands")
+        if started is not None:
+            self.record_write(self.batch_verb, started, started)
+
+        number_of_queries = self.count_queries(messages)
+        answers = []
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while len(answers) < number_of_queries and not self.not_ready.is_set():
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise AdapterError(f"timeout error: the operation took longer than {timeout} seconds")
+            answer = await self.wait_for(
+                lambda: self.output.take(0, lines=1)[0] or (b"" if self.not_ready.is_set() else None),
+                min(remaining, self.ready_timeout)
+            )
+            if answer:
+                answers.append(answer.decode(errors="replace").strip())
+        if not await self.wait_until_not_ready(self.ready_timeout):
+            self.batch_settled()
+            if started is not None:
+                self.record_output(sum(len(answer) for answer in answers))
+            return answers
+
+        await self.wait_for_silence(self.max_retry_backoff)
+        self.batch_settled()
+        answers = []
+        for message in messages:
+            if message.startswith(self.query_prefix):
+                answers.append(await self.query(message, timeout))
+            else:
+                await self.send([message])
+        return answers
+
+    async def wait_for_silence(self, gap):
+        """
+        waits until hpctrl doesn't print anything for gap seconds, see Adapter.wait_for_silence
+        """
+        while await self.wait_for(lambda: self.output.take(0, lines=1)[0], gap) is not None:
+            pass
+
+    async def send_and_get_output(self, messages, timeout, lines=None, terminator=None, idle=None, raw=False):
+        """
+        calls self.send(messages) and then self.get_output(timeout, lines, terminator, idle, raw)
+        """
+        await self.send(messages, awaited=True)
+        return await self.get_output(timeout, lines, terminator, idle, raw)
+
+    async def send_and_get_block(self, messages, timeout):
+        """
+        calls self.send(messages) and then self.get_block(timeout)
+        """
+        await self.send(messages, awaited=True)
+        return await self.get_block(timeout)
+
+    async def connect(self, address):
+        """
+        connets with LOGON, OSCI, CONNECT {address} commands
+        """
+        await self.send([self.cmd_logon, self.cmd_osci, f"{self.cmd_connect} {address}"])
+        self.address = address
+        self.connected = True
+
+    async def disconnect(self):
+        """
+        disconnets with DISCONNECT command if possible
+        """
+        if not self.connected:
+            return
+        await self.send([self.cmd_disconnect])
+        self.address = None
+        self.connected = False
+
+    async def enter_cmd_mode(self):
+        """
+        enters cmd mode with CMD command if possible
+        """
+        if not self.connected or self.in_cmd_mode:
+            return
+        await self.send([self.cmd_enter_cmd])
+        self.in_cmd_mode = True
+
+    async def exit_cmd_mode(self):
+        """
+        exits cmd mode with . command if possible
+        """
+        if not self.connected or not self.in_cmd_mode:
+            return
+        await self.send([self.cmd_leave_cmd])
+        self.in_cmd_mode = False
+
+
+class EventLoopThread:
+    """
+    one asyncio event loop running in a daemon thread, synchronous code (e.g. the GUI) submits coroutines
+    to it, so long waits share the loop instead of each sleeping in its own thread
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def submit(self, coroutine):
+        """
+        schedules the coroutine on the loop and returns a concurrent.futures.Future of its result
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine, timeout=None):
+        """
+        runs the coroutine on the loop and waits for its result
+        """
+        return self.submit(coroutine).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
@@ -0,0 +1,94 @@
+import mmap
+import numpy as np
+
+
+class CaptureError(Exception):
+    pass
+
+
+class CaptureFile:
+    """
+    random access to records of a file written by hpctrl during a continuous measurement. The file is
+    memory-mapped and byte offsets of records are found in one pass, so records can be read without
+    decoding (or even reading) the rest of the file.
+    Every record is lines_per_record lines long (2 if preambles are on: preamble and data line),
+    the data line starts with the number of microseconds from the first measurement.
+    Channels of records alternate in the order of channels (string, e.g. "23")
+    """
+    # number of bytes searched for newlines at once while building the index
+    scan_size = 1 << 26
+
+    def __init__(self, path, channels, lines_per_record=1):
+        if not channels:
+            raise CaptureError("no channels were given")
+        self.path = path
+        self.channels = channels
+        self.lines_per_record = lines_per_record
+        self.file = open(path, "rb")
+        try:
+            self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file can't be mapped
+            self.buffer = b""
+        self.offsets = self.build_index()
+
+    def build_index(self):
+        """
+        returns byte offsets of records as an uint64 array, the last item is the end of the last record
+        """
+        size = len(self.buffer)
+        line_ends = []
+        for start in range(0, size, self.scan_size):
+            chunk = np.frombuffer(self.buffer, dtype=np.uint8, count=min(self.scan_size, size - start), offset=start)
+            line_ends.append(np.flatnonzero(chunk == ord("\n")).astype(np.uint64) + (start + 1))
+        line_ends = np.concatenate(line_ends) if line_ends else np.empty(0, dtype=np.uint64)
+        if size and (not len(line_ends) or line_ends[-1] != size):
+            line_ends = np.append(line_ends, np.uint64(size))
+        records = len(line_ends) // self.lines_per_record
+        offsets = np.empty(records + 1, dtype=np.uint64)
+        offsets[0] = 0
+        offsets[1:] = line_ends[self.lines_per_record - 1:records * self.lines_per_record:self.lines_per_record]
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def record_range(self, i):
+        """
+        returns byte offsets (start, end) of the i-th record
+        """
+        if not 0 <= i < len(self):
+            raise IndexError(f"record {i} out of range")
+        return int(self.offsets[i]), int(self.offsets[i + 1])
+
+    def record(self, i):
+        """
+        returns (preamble, data line) of the i-th record as bytes, preamble is None without preambles
+        """
+        start, end = self.record_range(i)
+        lines = self.buffer[start:end].splitlines()
+        if self.lines_per_record == 1:
+            return None, lines[0]
+        return lines[0].strip(), lines[1]
+
+    def channel(self, i):
+        return self.channels[i % len(self.channels)]
+
+    def timestamp(self, i):
+        """
+        returns the number of microseconds from the first measurement of the i-th record
+        """
+        start, end = self.record_range(i)
+        if self.lines_per_record == 2:
+            start = self.buffer.find(b"\n", start, end) + 1
+        return int(self.buffer[start:self.buffer.find(b" ", start, end)])
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,9 +1,9 @@
 import threading
 import time
 import os
-import backend.measurement as ms
-import PySimpleGUI as sg
 from backend.adapter import Adapter, AdapterError
+from backend.state import InstrumentState
+from backend.pool import AdapterPool, select, selected_instrument
 from abc import ABC, abstractmethod
 
 
@@ -11,15 +11,89 @@ class CommandError(Exception):
     pass
 
 
-def send_cmd(command):
-    adapter.send(command)
+def get_adapter():
+    """
+    returns the adapter of the instrument selected in this thread (see backend.pool.select)
+    or the default adapter
+    """
+    instrument = selected_instrument()
+    return default_adapter() if instrument is None else instrument.adapter
+
+
+def default_adapter():
+    """
+    returns the adapter of the GUI, it's created on first use so importing this module doesn't look for hpctrl.
+    If hpctrl can't be found, the AdapterError is returned instead
+    """
+    global adapter
+    if adapter is None:
+        try:
+            adapter = Adapter(testing=not in_production)
+        except AdapterError as e:
+            adapter = e
+    return adapter
 
 
-def send_cmd_with_output(command, timeout=5):
-    return adapter.send_and_get_output(command, timeout)
+def get_state():
+    """
+    returns the state cache of the instrument selected in this thread or of the default adapter
+    """
+    instrument = selected_instrument()
+    return state if instrument is None else instrument.state
+
+
+def send_cmd(command):
+    get_adapter().send(command)
+    get_state().update(command)
+
+
+def send_cmd_with_output(command, timeout=5, lines=None, terminator=None, idle=None, raw=False):
+    """
+    sends the command and returns the response, see Adapter.get_output for how the response ends
+    """
+    output = get_adapter().send_and_get_output(command, timeout, lines, terminator, idle, raw)
+    get_state().update(command)
+    return output
+
+
+def send_cmd_batch(commands, timeout=5):
+    """
+    sends set and query commands in one write, returns answers to the queries in their order
+    """
+    answers = get_adapter().send_batch(commands, timeout)
+    get_state().update(commands)
+    return answers
+
+
+def send_query(query, refresh=False, lines=None, terminator=None, idle=None):
+    """
+    returns the answer to the query from the state cache or sends it if the answer isn't cached
+    (or refresh is True) and caches the answer
+    """
+    answer = None if refresh else get_state().answer(query)
+    if answer is None:
+        answer = send_cmd_with_output(query, lines=lines, terminator=terminator, idle=idle)
+        get_state().store(query, answer)
+    return answer
+
+
+def get_set_values(commands, refresh=False):
+    """
+    returns get_set_value() of every command, queries without a cached answer are sent in one batch
+    """
+    answers = [None if refresh else get_state().answer(command.query) for command in commands]
+    missing = [i for i, answer in enumerate(answers) if answer is None]
+    if missing:
+        queries = [commands[i].query for i in missing]
+        for i, query, answer in zip(missing, queries, send_cmd_batch(queries)):
+            get_state().store(query, answer)
+            answers[i] = answer
+    return [command.parse(answer) for command, answer in zip(commands, answers)]
 
 
 class Command(ABC):
+    # query answered with the currently set value, see get_set_value
+    query = None
 
     @abstractmethod
     def do(self):
@@ -32,8 +106,19 @@ class Command(ABC):
         self.check()
         self.do()
 
-    def get_set_value(self):
-        pass
+    def parse(self, answer):
+        """
+        converts the answer to self.query to the set value
+        """
+        return answer
+
+    def get_set_value(self, refresh=False):
+        """
+        returns the currently set value, from the state cache unless refresh is True
+        """
+        if self.query is None:
+            return None
+        return self.parse(send_query(self.query, refresh, lines=1))
 
 
 class ConnectCmd(Command):
@@ -41,7 +126,7 @@ class ConnectCmd(Command):
         self.address = address
 
     def do(self):
-        adapter.connect(self.address)
+        get_adapter().connect(self.address)
 
     def check(self):
         if self.address not in [str(i) for i in range(1, 32)]:
@@ -50,23 +135,23 @@ class ConnectCmd(Command):
 
 class DisconnectCmd(Command):
     def do(self):
-        adapter.disconnect()
+        get_adapter().disconnect()
 
 
 class EnterCmdModeCmd(Command):
     def do(self):
-        adapter.enter_cmd_mode()
+        get_adapter().enter_cmd_mode()
 
 
 class LeaveCmdModeCmd(Command):
     def do(self):
-        adapter.exit_cmd_mode()
+        get_adapter().exit_cmd_mode()
 
 
 class GetOutput(Command):
     def do(self, timeout=0.2):
         try:
-            return adapter.get_output(timeout)
+            return get_adapter().get_output(timeout)
         except AdapterError:
             return None
 
@@ -83,14 +168,17 @@ class CustomCmd(Command):
 
 
 class CustomCmdWithOutput(Command):
-    def __init__(self, cmd):
+    def __init__(self, cmd, lines=None, terminator=None, idle=None):
         self.cmd = cmd
+        self.lines = lines
+        self.terminator = terminator
+        self.idle = idle
 
     def do(self):
         """
         sends one command and returns output from hpctrl
         """
-        return send_cmd_with_output(self.cmd)
+        return send_cmd_with_output(self.cmd, lines=self.lines, terminator=self.terminator, idle=self.idle)
 
 
 class FileCmd(Command):
@@ -105,6 +193,8 @@ class FileCmd(Command):
 
 
 class PointsCmd(Command):
+    query = "q :ACQUIRE:POINTS?"
+
     def __init__(self, points=None):
         self.points = points
 
@@ -115,11 +205,11 @@ class PointsCmd(Command):
         if self.points not in [str(i) for i in range(16, 4097)] and self.points.lower() != "auto":
             raise CommandError(f"{self.points} is not in range 16-4096")
 
-    def get_set_value(self):
-        return send_cmd_with_output("q :ACQUIRE:POINTS?")
 
 
 class AverageNoCmd(Command):
+    query = "q :ACQUIRE:count?"
+
     def __init__(self, count=None):
         self.count = count
 
@@ -130,11 +220,10 @@ class AverageNoCmd(Command):
         if self.count not in [str(i) for i in range(1, 4097)]:
             raise CommandError(f"{self.count} is not in range 1-4096")
 
-    def get_set_value(self):
-        return send_cmd_with_output("q :ACQUIRE:count?")
 
 
 class AverageCmd(Command):
+    query = "q :acquire:average?"
 
     def do(self, turn_on):
         if turn_on:
@@ -142,13 +231,14 @@ class AverageCmd(Command):
         else:
             send_cmd("s :acquire:average off")
 
-    def get_set_value(self):
-        return send_cmd_with_output("q :acquire:average?") == "1"
+    def parse(self, answer):
+        return answer == "1"
 
 
 class ExitHpctrlCmd(Command):
     def do(self):
-        adapter.kill_hpctrl()
+        get_adapter().kill_hpctrl()
+        get_state().clear()
 
 
 class CheckIfResponsiveCmd(Command):
@@ -156,15 +246,41 @@ class CheckIfResponsiveCmd(Command):
         """
         do method returns true if hpctrl responds to q *IDN?
         """
-        return adapter.is_osci_responsive()
+        return get_adapter().is_osci_responsive()
 
 
 class GetPreambleCmd(Command):
-    def do(self):
+    def do(self, refresh=False):
+        """
+        do method returns preamble data, cached for the current waveform source until a setting changes
+        or a new acquisition starts
         """
-        do method returns preamble data
+        return send_query("q :WAVEFORM:PREAMBLE?", refresh)
+
+
+class GetWaveformBlockCmd(Command):
+    def do(self, timeout=5):
+        """
+        do method returns waveform data (after s :waveform:data?) transferred as one binary block
+        of little-endian 16-bit words
         """
-        return send_cmd_with_output("q :WAVEFORM:PREAMBLE?")
+        return get_adapter().send_and_get_block("b16", timeout)
+
+
+class GetWaveformWordsCmd(Command):
+    def do(self, points=None, timeout=5):
+        """
+        do method returns waveform data (after s :waveform:data?) as bytes of decimal words, one per line.
+        The first line is a count. If it's the number of points of the preamble, the response is framed by it,
+        otherwise it ends when hpctrl doesn't print anything for 100 ms (samples come as the oscilloscope sends
+        them over GPIB)
+        """
+        count = send_cmd_with_output("16", timeout, lines=1, raw=True)
+        if not count.isdigit():
+            raise CommandError(f"expected the number of words, got '{count[:40].decode(errors='replace')}'")
+        if points is not None and int(count) == points:
+            return get_adapter().get_output(timeout, lines=points, raw=True) if points else b""
+        return get_adapter().get_output(timeout, idle=0.1, raw=True)
 
 
 class FactoryResetCmd(Command):
@@ -221,26 +337,152 @@ class TurnOffChannelCmd(Command):
 class ChannelCmd(Command):
     def __init__(self, channel):
         self.channel = channel
+        self.query = f"q :channel{channel}:display?"
 
     def do(self):
         pass
 
-    def get_set_value(self):
-        return send_cmd_with_output(f"q :channel{self.channel}:display?") == "1"
+    def parse(self, answer):
+        return answer == "1"
 
 
 class ChangeWaveformSourceCmd(Command):
+    query = "q :waveform:source?"
+
     def __init__(self, channel):
         self.channel = channel
 
     def do(self):
-        send_cmd(f"s :waveform:source channel{self.channel}")
+        command = f"s :waveform:source channel{self.channel}"
+        if not get_state().is_set(command):
+            send_cmd(command)
+
+
+def get_env_option(name, default, options):
+    value = os.getenv(name, default).lower()
+    if value not in options:
+        raise CommandError(f"{name} '{value}' is not one of {', '.join(options)}")
+    return value
+
+
+def get_env_int(name, default, minimum):
+    value = os.getenv(name, str(default))
+    if not value.isdigit() or int(value) < minimum:
+        raise CommandError(f"{name} '{value}' is not a number greater or equal to {minimum}")
+    return int(value)
 
-    def get_set_value(self):
-        return send_cmd_with_output("q :waveform:source?")
+
+def get_env_float(name):
+    """
+    returns the number set by the environment variable or None if it isn't set
+    """
+    value = os.getenv(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise CommandError(f"{name} '{value}' is not a number")
+
+
+def save_options():
+    """
+    returns how the measurements should be saved, set by OSCI_OUTPUT_FORMAT, OSCI_ARCHIVE,
+    OSCI_SAVE_WORKERS, OSCI_COMPRESSION, OSCI_COMPRESSION_LEVEL and OSCI_SAVE_PIPELINE in .env
+    """
+    import backend.measurement as ms
+    import backend.storage as st
+    return ms.SaveOptions(
+        output_format=get_env_option("OSCI_OUTPUT_FORMAT", ms.TEXT_FORMAT, ms.OUTPUT_FORMATS),
+        archive=get_env_option("OSCI_ARCHIVE", ms.ARCHIVE_NONE, ms.ARCHIVE_MODES),
+        workers=get_env_int("OSCI_SAVE_WORKERS", 1, 1),
+        compression=get_env_option("OSCI_COMPRESSION", st.COMPRESSION_NONE, st.COMPRESSIONS),
+        compression_level=get_env_int("OSCI_COMPRESSION_LEVEL", 6, 0),
+        pipeline=os.getenv("OSCI_SAVE_PIPELINE") == "true",
+    )
+
+
+def run_preambles(chans):
+    """
+    returns the preamble of every channel for measurements saved without preambles
+    """
+    preambles = []
+    for ch in chans:
+        ChangeWaveformSourceCmd(ch).do()
+        preambles.append(GetPreambleCmd().do().split("\n")[-1])
+    return preambles
+
+
+def run_ingest(file_to_store_data_from_hpctrl):
+    """
+    returns the RunIngest saving measurements of the running RUN into the file or None, see start_run_cmds
+    """
+    return ingests.get(file_to_store_data_from_hpctrl)
+
+
+def run_output(file_to_store_data_from_hpctrl, timeout=0.2):
+    """
+    returns output of hpctrl during the RUN into the file or None, output means the RUN ended (e.g. an error
+    or a limit of hpctrl.cfg). Output while the RUN is restarted into a new file (see backend.ring.RunRing)
+    is left to the restart, an error of the restart is returned as output
+    """
+    ingest = run_ingest(file_to_store_data_from_hpctrl)
+    if ingest is None:
+        return GetOutput().do(timeout=timeout)
+    if not ingest.switching.acquire(timeout=timeout):
+        return None
+    try:
+        output = str(ingest.error) if ingest.error is not None else GetOutput().do(timeout=timeout)
+        if output is not None:
+            ingest.ending.set()
+        return output
+    finally:
+        ingest.switching.release()
+
+
+def start_run_cmds(file_to_store_data_from_hpctrl, channels, folder_to_store_measurements=None,
+                   is_preamble=False, reinterpret_trimmed_data=True):
+    """
+    starts RUN, hpctrl appends measurements to the file. If OSCI_RUN_INGEST is true and the folder is given,
+    measurements are saved while the RUN goes on (see backend.ingest) and stop_run_cmds saves only the rest.
+    If OSCI_RING_SECONDS is set, only the measurements of its last seconds are kept and saved, the RUN is
+    restarted into a new file every OSCI_RING_SEGMENT seconds (see backend.ring). The save options are checked
+    before the RUN starts, so stop_run_cmds doesn't fail on them
+    """
+    options = save_options()
+    ring_seconds = get_env_int("OSCI_RING_SECONDS", 0, 0)
+    if folder_to_store_measurements is not None and (os.getenv("OSCI_RUN_INGEST") == "true" or ring_seconds):
+        import backend.measurement as ms
+        from backend.ingest import RunIngest
+        from backend.ring import RunRing
+        ring_records = get_env_int("OSCI_RING_RECORDS", 1024, 1)
+        ring_segment = get_env_int("OSCI_RING_SEGMENT", 60, 0)
+        trigger_level = get_env_float("OSCI_RING_TRIGGER")
+        chans = channels_to_string(channels)
+        if is_preamble:
+            measurements = ms.MultipleMeasurementsWithPreambles(
+                file_to_store_data_from_hpctrl, chans, reinterpret_trimmed_data, None
+            )
+        else:
+            # the oscilloscope can't be asked while it's measuring
+            measurements = ms.MultipleMeasurementsNoPreambles(
+                file_to_store_data_from_hpctrl, run_preambles(chans), chans, reinterpret_trimmed_data, None
+            )
+        if os.path.isfile(file_to_store_data_from_hpctrl):
+            os.remove(file_to_store_data_from_hpctrl)
+        if ring_seconds:
+            instrument = selected_instrument()
+            ingest = RunRing(measurements, folder_to_store_measurements, options, ring_seconds, ring_records,
+                             trigger_level, ring_segment, lambda ring: restart_run_segment(
+                                 ring, file_to_store_data_from_hpctrl, channels, is_preamble, instrument
+                             ))
+        else:
+            ingest = RunIngest(measurements, folder_to_store_measurements, options)
+        ingests[file_to_store_data_from_hpctrl] = ingest
+    start_acquisition(file_to_store_data_from_hpctrl, channels)
 
 
-def start_run_cmds(file_to_store_data_from_hpctrl, channels):
+def start_acquisition(file_to_store_data_from_hpctrl, channels):
     LeaveCmdModeCmd().do()
     FileCmd(file_to_store_data_from_hpctrl).do()
     EnterCmdModeCmd().do()
@@ -248,71 +490,187 @@ def start_run_cmds(file_to_store_data_from_hpctrl, channels):
     StartDataAcquisitionCmd().do()
 
 
-def stop_run_cmds(file_with_data, folder_to_store_measurements, channels, is_preamble,
-                  reinterpret_trimmed_data, saving_gui_text: sg.Text, run_button: sg.Button, got_error):
-    if not got_error:
+def restart_run_segment(ring, file_to_store_data_from_hpctrl, channels, is_preamble, instrument):
+    """
+    stops the RUN, takes the measurements of the file hpctrl wrote into the ring (see backend.ring.RunRing),
+    removes the file and starts the RUN again into a new one. Runs in the thread of the ring
+    """
+    from backend.flush import RunFlush, expected_buffer_size
+    with select(instrument):
+        flush = RunFlush(file_to_store_data_from_hpctrl, expected_buffer_size(is_preamble))
         StopDataAcquisitionCmd().do()
+        if not flush.wait(get_adapter()):
+            raise CommandError(f"RUN wasn't restarted, {flush}")
+        ring.next_file()
+        os.remove(file_to_store_data_from_hpctrl)
+        ring.next_segment()
+        start_acquisition(file_to_store_data_from_hpctrl, channels)
+
+
+def stop_run_cmds(file_with_data, folder_to_store_measurements, channels, is_preamble,
+                  reinterpret_trimmed_data, saving_gui_text, run_button, got_error, expected_bytes=None):
+    """
+    stops RUN and saves the measurements in a thread which is returned, STOP is sent by the thread after
+    a restart of the RUN into a new file in progress is done (see backend.ring.RunRing). saving_gui_text and
+    run_button can be anything with update(value=..., visible=...) and Update(...) like sg.Text and sg.Button.
+    The wait for hpctrl to write the file is scaled to expected_bytes (the buffer size from hpctrl.cfg
+    by default), its timings are kept in flushes (see backend.flush.RunFlush)
+    """
+    import backend.measurement as ms
+    from backend.flush import RunFlush, expected_buffer_size
+    ingest = ingests.pop(file_with_data, None)
+    if expected_bytes is None:
+        expected_bytes = expected_buffer_size(is_preamble)
+    if ingest is not None:
+        ingest.before_stop()
 
     def run():
-        start = time.time()
-        timeout = 5  # in seconds
-        while True:
-            try:
-                hpctrl_output = adapter.get_output(0.2)
-                if "!file written" in hpctrl_output:
-                    break
-            except AdapterError:
-                pass
-            if time.time() > start + timeout:
-                saving_gui_text.update(visible=False)
-                run_button.Update("RUN", button_color="#B9BBBE", disabled=False)
-                return
-            time.sleep(0.5)
+        if ingest is not None:
+            ingest.wait_for_switch()
+        flush = flushes[file_with_data] = RunFlush(file_with_data, expected_bytes)
+        if not got_error:
+            StopDataAcquisitionCmd().do()
+        options = save_options()
+        saving_gui_text.update(value="Waiting for hpctrl")
+        if not flush.wait(get_adapter(), saving_gui_text):
+            if ingest is not None:
+                ingest.finish()
+            saving_gui_text.update(visible=False)
+            run_button.Update("RUN", button_color="#B9BBBE", disabled=False)
+            return
+        saving_gui_text.update(value=str(flush))
         chans = channels_to_string(channels)
-        if is_preamble:
+        if ingest is not None:
+            ingest.finish(saving_gui_text)
+        elif is_preamble:
             ms.MultipleMeasurementsWithPreambles(file_with_data, chans, reinterpret_trimmed_data,
                                                  saving_gui_text).save_to_disk(
-                folder_to_store_measurements
+                folder_to_store_measurements, options
             )
         else:
-            time.sleep(0.5)
-            preambles = []
-            for ch in chans:
-                ChangeWaveformSourceCmd(ch).do()
-                preamble = GetPreambleCmd().do().split("\n")[-1]
-                preambles.append(preamble)
+            preambles = run_preambles(chans)
             ms.MultipleMeasurementsNoPreambles(file_with_data, preambles, chans, reinterpret_trimmed_data,
                                                saving_gui_text).save_to_disk(
-                folder_to_store_measurements
+                folder_to_store_measurements, options
             )
         saving_gui_text.update(value="Removing temp.txt")
         os.remove(file_with_data)
         saving_gui_text.update(visible=False)
         run_button.Update(disabled=False)
 
-    thread = threading.Thread(target=run, args=())
+    instrument = selected_instrument()
+
+    def run_on_instrument():
+        with select(instrument):
+            run()
+
+    thread = threading.Thread(target=run_on_instrument, args=())
     thread.daemon = True
     thread.start()
+    return thread
+
+
+def single_transfers(chans, reinterpret_trimmed_data, instrument):
+    """
+    yields a measurement of every channel as soon as its waveform and preamble are transferred, the waveform
+    is decoded on first use. Commands go to the instrument, the generator can be iterated by another thread
+    """
+    import backend.measurement as ms
+    binary_transfer = os.getenv("OSCI_BINARY_TRANSFER") == "true"
+    for ch in chans:
+        with select(instrument):
+            ChangeWaveformSourceCmd(ch).do()
+            preamble = GetPreambleCmd().do()
+            CustomCmd("s :waveform:data?").do()
+            if binary_transfer:
+                data = ms.words_from_block(GetWaveformBlockCmd().do())
+            else:
+                # the response is parsed from bytes at once
+                data = GetWaveformWordsCmd().do(ms.Preamble.from_string(preamble.split("\n")[-1]).points)
+        yield ms.LazyMeasurement(preamble, data, ch, reinterpret_trimmed_data)
 
 
 def single_cmds(channels, path, reinterpret_trimmed_data, saving_gui_text):
+    """
+    triggers SINGLE and saves a measurement of every channel. Channels are transferred one after another
+    while the previous ones are decoded and written (see Measurements.save_to_disk_pipelined). Returns
+    seconds the capture took in total and seconds busy transferring, decoding and writing
+    """
+    import backend.measurement as ms
+    options = save_options()
+    options.pipeline = True
+    started = time.perf_counter()
     CustomCmd("s single").do()
-    measurements = []
-    for i in channels_to_string(channels):
-        ChangeWaveformSourceCmd(i).do()
-        CustomCmd("s :waveform:data?").do()
-        data = CustomCmdWithOutput("16").do()
-        # cut the count
-        data = data[(data.find("\n") + 1):]
-        preamble = GetPreambleCmd().do()
-        measurements.append(ms.Measurement(preamble, data, i, reinterpret_trimmed_data))
-    ms.SingleMeasurements(measurements, saving_gui_text).save_to_disk(path)
+    chans = channels_to_string(channels)
+    measurements = ms.SingleMeasurements(
+        single_transfers(chans, reinterpret_trimmed_data, selected_instrument()), saving_gui_text, chans
+    )
+    measurements.save_to_disk(path, options)
     TurnOnRunModeCmd().do()
     saving_gui_text.update(visible=False)
+    read, decode, write = measurements.pipeline.stages
+    return {
+        "total": time.perf_counter() - started,
+        "transfer": read.busy,
+        "decode": decode.busy,
+        "write": write.busy,
+    }
+
+
+def repeat_single_cmds(channels, path, reinterpret_trimmed_data, saving_gui_text, count, interval,
+                       stop=None, on_capture=None):
+    """
+    triggers SINGLE count times, interval seconds from start to start. A capture taking longer than interval
+    delays the next one, the delay is its lag, and the schedule goes on from the delayed start (lags don't add
+    up over captures behind schedule). stop (threading.Event) ends the captures early and
+    on_capture(index, timings) is called after every capture (see single_cmds). Returns CaptureMetrics
+    """
+    from backend.metrics import CaptureMetrics
+    metrics = CaptureMetrics()
+    scheduled = time.perf_counter()
+    for index in range(count):
+        if stop is not None and stop.is_set():
+            break
+        started = time.perf_counter()
+        timings = single_cmds(channels, path, reinterpret_trimmed_data, saving_gui_text)
+        timings["lag"] = max(started - scheduled, 0)
+        metrics.record("single", **timings)
+        if on_capture is not None:
+            on_capture(index, timings)
+        scheduled = max(scheduled, started) + interval
+        if index + 1 < count:
+            wait = scheduled - time.perf_counter()
+            if wait > 0:
+                if stop is None:
+                    time.sleep(wait)
+                else:
+                    stop.wait(wait)
+    return metrics
+
+
+def config_cmds(path, inputs=(), input_char="#"):
+    """
+    returns set commands of a config file (one command per line without 's ', see CustomConfig),
+    the input_char of every line is replaced by the next of inputs
+    """
+    with open(path) as f:
+        lines = [" ".join(line.split()) for line in f.readlines()]
+    inputs = list(inputs)
+    commands = []
+    for line in lines:
+        if not line:
+            continue
+        if input_char in line:
+            if not inputs:
+                raise CommandError(f"'{line}' in {path} has no input")
+            line = line.replace(input_char, inputs.pop(0), 1)
+        commands.append(f"s {line}")
+    return commands
 
 
 def initialize_cmds(address):
-    adapter.start_hpctrl()
+    get_state().clear()
+    get_adapter().start_hpctrl()
     ConnectCmd(address).check_and_do()
     EnterCmdModeCmd().do()
 
@@ -336,12 +694,83 @@ def disengage_cmd():
     ExitHpctrlCmd().do()
 
 
+def instrument_path(path, instrument):
+    """
+    returns the folder in path where the measurements of the instrument are saved, every instrument
+    of a multi-instrument measurement has its own
+    """
+    path = os.path.join(path, str(instrument))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def instrument_file(file, instrument):
+    """
+    returns the file with the name of the instrument appended, e.g. temp_gpib7.txt
+    """
+    root, extension = os.path.splitext(file)
+    return f"{root}_{instrument}{extension}"
+
+
+def initialize_instruments_cmds(addresses):
+    """
+    starts hpctrl for every address of the pool and connects to the oscilloscopes at once
+    """
+    pool.run_each(addresses, lambda instrument: initialize_cmds(instrument.address))
+
+
+def disengage_instruments_cmd(addresses):
+    pool.run_each(addresses, lambda instrument: disengage_cmd())
+    for address in addresses:
+        pool.remove(address)
+
+
+def single_instruments_cmds(addresses, channels, path, reinterpret_trimmed_data, saving_gui_text):
+    """
+    triggers SINGLE on all instruments at once, measurements of every instrument are saved into its own folder.
+    Returns timings of every instrument, see single_cmds
+    """
+    return pool.run_each(addresses, lambda instrument: single_cmds(
+        channels, instrument_path(path, instrument), reinterpret_trimmed_data, saving_gui_text
+    ))
+
+
+def start_run_instruments_cmds(file_to_store_data_from_hpctrl, addresses, channels, folder_to_store_measurements=None,
+                               is_preamble=False, reinterpret_trimmed_data=True):
+    """
+    starts RUN on all instruments at once, every hpctrl writes into its own file (see instrument_file)
+    """
+    pool.run_each(addresses, lambda instrument: start_run_cmds(
+        instrument_file(file_to_store_data_from_hpctrl, instrument), channels,
+        None if folder_to_store_measurements is None else instrument_path(folder_to_store_measurements, instrument),
+        is_preamble, reinterpret_trimmed_data
+    ))
+
+
+def stop_run_instruments_cmds(file_with_data, addresses, folder_to_store_measurements, channels, is_preamble,
+                              reinterpret_trimmed_data, saving_gui_text, run_button, got_error, expected_bytes=None):
+    """
+    stops RUN on all instruments, measurements of every instrument are saved into its own folder by a thread,
+    the threads are returned in the order of addresses. got_error is True if hpctrl of every instrument
+    reported an error, or the addresses of those which did (STOP isn't sent to them)
+    """
+    return pool.run_each(addresses, lambda instrument: stop_run_cmds(
+        instrument_file(file_with_data, instrument), instrument_path(folder_to_store_measurements, instrument),
+        channels, is_preamble, reinterpret_trimmed_data, saving_gui_text, run_button,
+        got_error if isinstance(got_error, bool) else instrument.address in got_error, expected_bytes
+    ))
+
+
 def channels_to_string(channels):
     return "".join(sorted(ch[2:] for ch in channels))
 
 
+state = InstrumentState()
 in_production = os.getenv("OSCI_IN_PRODUCTION") == "true"
-try:
-    adapter = Adapter(testing=not in_production)
-except AdapterError as e:
-    adapter = e
+pool = AdapterPool(testing=not in_production)
+# see default_adapter
+adapter = None
+# RunIngest of every running RUN by its file, see start_run_cmds
+ingests = {}
+# RunFlush of the last stopped RUN by its file, see stop_run_cmds
+flushes = {}
@@ -0,0 +1,140 @@
+import os
+import time
+from backend.adapter import AdapterError
+
+HPCTRL_CONFIG = "hpctrl.cfg"
+FILE_WRITTEN = "!file written"
+
+
+def hpctrl_limits(path=HPCTRL_CONFIG):
+    """
+    returns the limits of a continuous measurement from hpctrl.cfg (e.g. {"MAXBUFFERSIZE": 1000000000}),
+    empty if the file can't be read. hpctrl reads it from the folder it's started in
+    """
+    limits = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                words = line.split()
+                if len(words) == 2 and not words[0].startswith("#") and words[1].isdigit():
+                    limits[words[0].upper()] = int(words[1])
+    except OSError:
+        pass
+    return limits
+
+
+def expected_buffer_size(is_preamble, limits=None):
+    """
+    returns the most bytes hpctrl can have buffered when RUN stops, preambles have a buffer of their own
+    """
+    limits = hpctrl_limits() if limits is None else limits
+    size = limits.get("MAXBUFFERSIZE", RunFlush.default_buffer_size)
+    if is_preamble:
+        size += limits.get("MAXPREAMBLEBUFFERSIZE", 0)
+    return size
+
+
+class RunFlush:
+    """
+    waits until hpctrl writes the buffered measurements into the file after RUN stops. It's done when
+    hpctrl prints "!file written". The wait gives up stall_timeout seconds after the last sign of progress
+    (output of hpctrl or growth of the file), and at the latest after the time writing of the expected
+    number of bytes takes at min_write_rate. Times are perf_counter seconds from stopped
+    """
+    # seconds without output of hpctrl or growth of the file after which the flush is considered stuck
+    stall_timeout = 5.0
+    # bytes per second hpctrl writes the file at least, scales the timeout with the expected size
+    min_write_rate = 10e6
+    # seconds between checks of the file size
+    poll_interval = 0.05
+    # used if hpctrl.cfg can't be read, hpctrl's default buffer size
+    default_buffer_size = 1000000000
+
+    def __init__(self, file_path, expected_bytes, stopped=None):
+        """
+        stopped is the perf_counter time when RUN was stopped, now if None
+        """
+        self.file_path = file_path
+        self.expected_bytes = expected_bytes
+        self.stopped = time.perf_counter() if stopped is None else stopped
+        self.timeout = self.stall_timeout + expected_bytes / self.min_write_rate
+        self.first_growth = None
+        self.last_growth = None
+        self.written = None
+        self.size = self.file_size()
+        self.initial_size = self.size
+        self.output = []
+
+    def file_size(self):
+        try:
+            return os.path.getsize(self.file_path)
+        except OSError:
+            return 0
+
+    def wait(self, adapter, saving_gui_text=None):
+        """
+        returns True when the file is written, False when the wait gave up. Other output of hpctrl
+        is kept in self.output
+        """
+        last_progress = self.stopped
+        while True:
+            try:
+                output = adapter.get_output(self.poll_interval, terminator=FILE_WRITTEN)
+                now = time.perf_counter()
+                self.output.append(output)
+                last_progress = now
+                if FILE_WRITTEN in output:
+                    self.written = now
+                    self.check_growth(now)
+                    return True
+            except AdapterError:
+                now = time.perf_counter()
+            if self.check_growth(now):
+                last_progress = now
+                if saving_gui_text is not None:
+                    saving_gui_text.update(value=f"Writing temp.txt {self.size / 1e6:.1f} MB")
+            if not adapter.is_hpctrl_running() or now > last_progress + self.stall_timeout \
+                    or now > self.stopped + self.timeout:
+                return False
+
+    def check_growth(self, now):
+        """
+        returns True if the file grew since the last check
+        """
+        size = self.file_size()
+        if size <= self.size:
+            return False
+        self.size = size
+        if self.first_growth is None:
+            self.first_growth = now
+        self.last_growth = now
+        return True
+
+    def seconds(self, at):
+        return None if at is None else at - self.stopped
+
+    def timings(self):
+        """
+        returns seconds from STOP to the first and last growth of the file and to "!file written",
+        bytes written after STOP and the write rate in bytes per second
+        """
+        written_bytes = self.size - self.initial_size
+        start, end = self.first_growth, self.last_growth
+        return {
+            "first_growth": self.seconds(self.first_growth),
+            "last_growth": self.seconds(self.last_growth),
+            "file_written": self.seconds(self.written),
+            "bytes": written_bytes,
+            "rate": written_bytes / (end - start) if start is not None and end > start else None,
+        }
+
+    def __str__(self):
+        timings = self.timings()
+        if self.written is None:
+            return f"hpctrl didn't write the file in {time.perf_counter() - self.stopped:.3f}s"
+        text = f"file written {timings['file_written']:.3f}s after STOP, {timings['bytes'] / 1e6:.1f} MB"
+        if timings["first_growth"] is not None:
+            text += f", writing started after {timings['first_growth']:.3f}s"
+        if timings["rate"] is not None:
+            text += f" at {timings['rate'] / 1e6:.1f} MB/s"
+        return text
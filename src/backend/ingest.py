@@ -0,0 +1,179 @@
+import os
+import threading
+import backend.measurement as ms
+
+
+class RunIngest:
+    """
+    decodes and saves measurements while hpctrl is still appending them to the file during RUN, so only
+    the records written since the last poll are left to save after STOP. Whole records are read from
+    where the previous poll stopped, a partly written record waits for the next poll. The file has to be
+    a regular file (hpctrl writes it), it's read by seeking to the offset
+    """
+    # seconds between checks of the file size
+    poll_interval = 0.2
+    # bytes read at once when looking for the end of the last whole record
+    chunk_size = 1 << 20
+
+    def __init__(self, measurements, path, options=None):
+        """
+        measurements is a MultipleMeasurementsWithPreambles or MultipleMeasurementsNoPreambles of the file,
+        they're saved into path like by Measurements.save_to_disk
+        """
+        self.measurements = measurements
+        self.path = path
+        self.options = options or ms.SaveOptions()
+        os.makedirs(path, exist_ok=True)
+        # byte offset and index of the first measurement not read yet
+        self.offset = 0
+        self.index = 0
+        # measurements taken from the file and measurements saved
+        self.ingested = 0
+        self.saved = 0
+        # measurements taken from previous files, see next_file
+        self.file_start = 0
+        # bytes of the file read by complete_end, the end of the last whole record in them and lines after it
+        self.scanned = 0
+        self.record_end = 0
+        self.lines = 0
+        self.archives = {}
+        self.stats = ms.SaveStats()
+        self.error = None
+        self.lock = threading.Lock()
+        # held while the RUN is restarted into a new file, output of hpctrl meanwhile isn't an error
+        self.switching = threading.Lock()
+        # set when the RUN ended or is being stopped, it isn't restarted anymore
+        self.ending = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.poll, daemon=True)
+        self.thread.start()
+
+    def poll(self):
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                with self.lock:
+                    end = self.complete_end()
+                    if end > self.offset:
+                        self.ingest(end)
+            except Exception as error:
+                self.error = error
+                return
+
+    def complete_end(self):
+        """
+        returns the byte offset after the last whole record in the file. Only bytes appended since the last
+        call are read, in chunks of chunk_size, the newlines after the last whole record are counted
+        """
+        try:
+            size = os.path.getsize(self.measurements.file_path)
+        except FileNotFoundError:
+            return self.offset
+        if size < self.offset:
+            # the file was written again from the start, measurements already taken are skipped
+            self.offset = self.index = 0
+        if self.record_end != self.offset or size < self.scanned:
+            self.scanned = self.record_end = self.offset
+            self.lines = 0
+        lines_per_record = self.measurements.lines_per_measurement
+        with open(self.measurements.file_path, "rb") as f:
+            f.seek(self.scanned)
+            while self.scanned < size:
+                chunk = f.read(min(self.chunk_size, size - self.scanned))
+                if not chunk:
+                    break
+                lines = self.lines + chunk.count(b"\n")
+                if lines >= lines_per_record:
+                    end = len(chunk)
+                    for _ in range(lines % lines_per_record + 1):
+                        end = chunk.rfind(b"\n", 0, end)
+                    self.record_end = self.scanned + end + 1
+                self.lines = lines % lines_per_record
+                self.scanned += len(chunk)
+        return self.record_end
+
+    def ingest(self, end=None):
+        """
+        takes measurements between the offset and end (the end of the file if None), see add
+        """
+        if end is None:
+            end = os.path.getsize(self.measurements.file_path) if os.path.isfile(self.measurements.file_path) else 0
+        for measurement in self.measurements.parse_file(self.offset, end, self.index):
+            self.index += 1
+            if self.index <= self.ingested - self.file_start:
+                continue
+            self.ingested += 1
+            self.add(measurement)
+        self.offset = max(self.offset, end)
+
+    def next_file(self):
+        """
+        takes the rest of the file, the next measurements are read from the start of a new file (hpctrl
+        writes it after the file is removed and the RUN started again)
+        """
+        with self.lock:
+            self.ingest()
+            self.offset = self.index = 0
+            self.file_start = self.ingested
+
+    def add(self, measurement):
+        """
+        called with every measurement taken from the file, saves it
+        """
+        self.save(measurement, self.path, self.archives)
+
+    def save(self, measurement, path, archives):
+        """
+        writes the measurement into its own file in path or appends it to its archive in archives
+        """
+        if self.options.archive != ms.ARCHIVE_NONE:
+            archive = self.measurements.get_archive(archives, path, measurement.channel, self.options)
+            record, raw_bytes = self.measurements.encode_measurement(measurement, self.options)
+            archive.append(record, measurement.channel, measurement.us)
+            self.stats.add(raw_bytes, len(record))
+        else:
+            file = self.measurements.FileName(measurement.channel, self.measurements.get_extension(self.options))
+            self.stats.add(*self.measurements.write_measurement(path, measurement, self.options, file))
+        self.saved += 1
+
+    def before_stop(self):
+        """
+        called by stop_run_cmds before the RUN is stopped, the RUN isn't restarted into a new file anymore
+        """
+        self.ending.set()
+
+    def wait_for_switch(self):
+        """
+        returns when a restart of the RUN into a new file in progress is done, it can take as long as hpctrl
+        takes to write the file. Called by the saving thread of stop_run_cmds before STOP
+        """
+        with self.switching:
+            pass
+
+    def save_rest(self):
+        """
+        called by finish after the whole file is taken, every measurement is saved already
+        """
+
+    def finish(self, saving_gui_text=None):
+        """
+        stops polling, saves the rest of the file and closes archives. Call it after hpctrl wrote the
+        whole file, returns the number of saved measurements
+        """
+        self.stopped.set()
+        self.thread.join()
+        try:
+            with self.lock:
+                if self.error is not None:
+                    raise self.error
+                if saving_gui_text is not None:
+                    saving_gui_text.update(value=f"Saving the rest after {self.saved}")
+                self.ingest()
+                self.save_rest()
+        finally:
+            for archive in self.archives.values():
+                archive.close()
+        if saving_gui_text is not None:
+            saving_gui_text.update(
+                value=self.measurements.progress_text(self.saved, self.saved, self.options, self.stats)
+            )
+        return self.saved
@@ -1,11 +1,59 @@
 import os
-import PySimpleGUI as sg
+import time
+import numpy as np
+import backend.storage as st
+from backend.capture import CaptureFile
+from backend.pipeline import Pipeline, PipelineStage
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import lru_cache
+
+TEXT_FORMAT = "txt"
+# binary formats, see backend/storage.py
+BINARY_FORMATS = tuple(st.SAMPLE_DTYPES)
+OUTPUT_FORMATS = (TEXT_FORMAT, *BINARY_FORMATS)
+# none - one file per measurement, run - one archive for all channels, channel - one archive per channel
+ARCHIVE_NONE = "none"
+ARCHIVE_RUN = "run"
+ARCHIVE_CHANNEL = "channel"
+ARCHIVE_MODES = (ARCHIVE_NONE, ARCHIVE_RUN, ARCHIVE_CHANNEL)
+
+
+US_KEY = "Number of microseconds from the first measurement"
 
 
 class Preamble:
+    """
+    parsed preamble, immutable so that one instance can be shared by every measurement with the same preamble
+    (use Preamble.from_string). values holds the fields as sent by the oscilloscope in the order of labels,
+    fields needed for computations are also stored as numbers
+    """
+    __slots__ = ("values", "us", "points", "count", "x_increment", "x_origin", "y_increment", "y_origin", "text")
+    labels = (
+        "Type", "Points", "Count", "X increment", "X origin", "X reference", "Y increment", "Y origin",
+        "Y reference", "Coupling", "X display range", "X display origin", "Y display range", "Y display origin",
+        "Date", "Time", "Frame", "Module", "Acq mode", "Completion", "X units", "Y units", "Max bandwidth",
+        "Min bandwidth",
+    )
+
     def __init__(self, data):
-        self.preamble_dict = self.parse(data)
+        self.values, self.us = self.parse(data)
+        self.points = int(self.values[1])
+        self.count = int(self.values[2])
+        self.x_increment = float(self.values[3])
+        self.x_origin = float(self.values[4])
+        self.y_increment = float(self.values[6])
+        self.y_origin = float(self.values[7])
+        self.text = "".join(f"{key}:\t {val}\n" for key, val in zip(self.labels, self.values))
+
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def from_string(data):
+        """
+        returns a cached Preamble for the string, in no-preamble mode all records share a few preambles
+        """
+        return Preamble(data)
 
     def parse(self, data):
         _data = data.split(",")
@@ -16,109 +64,520 @@ class Preamble:
             type = "average"
         else:
             type = "unknown"
-        preamble_dict = {
-            'Type': type,
-            'Points': _data[2],
-            'Count': _data[3],
-            'X increment': _data[4],
-            'X origin': _data[5],
-            'X reference': _data[6],
-            'Y increment': _data[7],
-            'Y origin': _data[8],
-            'Y reference': _data[9],
-            'Coupling': _data[10],
-            'X display range': _data[11],
-            'X display origin': _data[12],
-            'Y display range': _data[13],
-            'Y display origin': _data[14],
-            'Date': _data[15],
-            'Time': _data[16],
-            'Frame': _data[17],
-            'Module': _data[18],
-            'Acq mode': _data[19],
-            'Completion': _data[20],
-            'X units': _data[21],
-            'Y units': _data[22],
-            'Max bandwidth': _data[23],
-            'Min bandwidth': _data[24],
-        }
-        if len(_data) == 25+1:
-            preamble_dict["Number of microseconds from the first measurement"] = _data[25]
+        us = _data[25] if len(_data) == 25+1 else None
+        return (type, *_data[2:25]), us
+
+    @property
+    def preamble_dict(self):
+        preamble_dict = dict(zip(self.labels, self.values))
+        if self.us is not None:
+            preamble_dict[US_KEY] = self.us
         return preamble_dict
 
     def __str__(self):
-        return "".join(f"{key}:\t {val}\n" for key, val in self.preamble_dict.items())
+        if self.us is not None:
+            return f"{self.text}{US_KEY}:\t {self.us}\n"
+        return self.text
+
+
+def parse_words(data):
+    """
+    parses whitespace separated 16-bit words from hpctrl into an int16 array,
+    data that are already an array (see words_from_block) are returned as they are.
+    Raises ValueError if a word isn't a number or doesn't fit into 16 bits
+    """
+    if isinstance(data, np.ndarray):
+        return data
+    # parsed wider first, int16 would wrap words out of its range silently
+    words = np.fromstring(data, dtype=np.int64, sep=" ")
+    if words.size and (words.min() < np.iinfo(np.int16).min or words.max() > np.iinfo(np.int16).max):
+        word = words[(words < np.iinfo(np.int16).min) | (words > np.iinfo(np.int16).max)][0]
+        raise ValueError(f"word {word} doesn't fit into 16 bits")
+    return words.astype(np.int16)
+
+
+def words_from_block(block):
+    """
+    returns an int16 array viewing a binary block of little-endian words from hpctrl, without copying it
+    """
+    return np.frombuffer(block, dtype="<i2")
+
+
+def decode_words(words, y_increment, y_origin, reinterpret_trimmed_data):
+    """
+    returns (data, holes), see Measurement.correct_data
+    """
+    values = words.astype(np.float64)
+    holes = np.zeros(words.shape, dtype=bool)
+    if reinterpret_trimmed_data:
+        values[words == Measurement.clipped_high] = Measurement.max_valid
+        values[words == Measurement.clipped_low] = Measurement.min_valid
+        holes = words == Measurement.hole
+    data = values * y_increment + y_origin
+    data[holes] = np.nan
+    return data, holes
+
+
+def decode_record(header, samples):
+    """
+    returns (data, holes) of a measurement saved in a binary format
+    """
+    if header["sample_format"] == "int16":
+        return decode_words(samples, header["y_increment"], header["y_origin"], header["reinterpret_trimmed_data"])
+    return samples, np.isnan(samples)
+
+
+def load_measurement(path):
+    """
+    loads a measurement saved in a binary format, returns (header, data, holes)
+    """
+    header, samples = st.load_record(path)
+    return (header, *decode_record(header, samples))
+
+
+def load_archived_measurement(archive: st.ArchiveReader, i):
+    """
+    loads the i-th measurement of an archive with binary records, returns (header, data, holes)
+    """
+    header, samples = archive.load(i)
+    return (header, *decode_record(header, samples))
 
 
 class Measurement:
+    clipped_high = 32256
+    clipped_low = 31744
+    max_valid = 30720
+    min_valid = -32736
+    hole = 31232
+    hole_corrected = "HOLE"
+
     def __init__(self, preamble, data, channel, reinterpret_trimmed_data):
-        self.preamble = Preamble(preamble)
+        """
+        preamble is a string from the oscilloscope or an already parsed Preamble
+        """
+        self.preamble = preamble if isinstance(preamble, Preamble) else Preamble.from_string(preamble)
+        self.us = self.preamble.us
         self.channel = channel
         self.reinterpret_trimmed_data = reinterpret_trimmed_data
-        self.clipped_high = 32256
-        self.clipped_low = 31744
-        self.max_valid = 30720
-        self.min_valid = -32736
-        self.hole = 31232
-        self.hole_corrected = "HOLE"
-        self.data = self.correct_data(data)
-
-    def correct_data(self, data):
-        _data = []
-        p_dict = self.preamble.preamble_dict
-        for i in data.split():
-            word_value = int(i)
-            if self.reinterpret_trimmed_data:
-                if word_value == self.clipped_high:
-                    word_value = self.max_valid
-                elif word_value == self.clipped_low:
-                    word_value = self.min_valid
-                elif word_value == self.hole:
-                    word_value = self.hole_corrected
-            if word_value != self.hole_corrected:
-                word_value = word_value * float(p_dict["Y increment"]) + float(
-                    p_dict["Y origin"]
-                )
-            _data.append(word_value)
-        return _data
+        self.words = parse_words(data)
+        self.data, self.holes = self.correct_data(self.words)
+
+    def correct_data(self, words):
+        """
+        returns (data, holes) where data are the words scaled by the Y increment and Y origin of the preamble
+        and holes is a boolean mask of samples the oscilloscope didn't measure (NaN in data)
+        """
+        return decode_words(words, self.preamble.y_increment, self.preamble.y_origin, self.reinterpret_trimmed_data)
 
     def __str__(self):
-        data = "".join(str(i) + "\n" for i in self.data)
-        return f"{self.preamble.__str__()}\n{data}"
+        values = self.data.tolist()
+        for i in np.flatnonzero(self.holes):
+            values[i] = self.hole_corrected
+        data = "".join(f"{value}\n" for value in values)
+        us = f"{US_KEY}:\t {self.us}\n" if self.us is not None else ""
+        return f"{self.preamble.text}{us}\n{data}"
 
     def append_us_to_preamble(self, us):
-        self.preamble.preamble_dict["Number of microseconds from the first measurement"] = us
+        """
+        the us stamp is kept on the measurement, the (shared) preamble isn't modified
+        """
+        self.us = us
+
+    def get_us(self):
+        return self.us
+
+    def raw_words(self):
+        """
+        returns the words as sent by the oscilloscope, without scaling or reinterpretation
+        """
+        return self.words
+
+    def __len__(self):
+        return len(self.words)
+
+
+class LazyMeasurement(Measurement):
+    """
+    Measurement that keeps the data line (str or bytes) and decodes it only on the first access
+    of words, data or holes, so measurements that are only passed through, counted or skipped
+    are never converted
+    """
+
+    def __init__(self, preamble, data, channel, reinterpret_trimmed_data):
+        self.preamble = preamble if isinstance(preamble, Preamble) else Preamble.from_string(preamble)
+        self.us = self.preamble.us
+        self.channel = channel
+        self.reinterpret_trimmed_data = reinterpret_trimmed_data
+        self.raw = data
+        self._words = None
+        self._decoded = None
+
+    @property
+    def words(self):
+        if self._words is None:
+            self._words = parse_words(self.raw)
+            self.raw = None
+        return self._words
+
+    @property
+    def data(self):
+        if self._decoded is None:
+            self._decoded = self.correct_data(self.words)
+        return self._decoded[0]
+
+    @property
+    def holes(self):
+        if self._decoded is None:
+            self._decoded = self.correct_data(self.words)
+        return self._decoded[1]
+
+    def __len__(self):
+        if self._words is None:
+            if isinstance(self.raw, np.ndarray):
+                return len(self.raw)
+            return len(self.raw.split())
+        return len(self._words)
+
+
+def count_lines(file_path, chunk_size=1 << 20):
+    """
+    counts lines in a file without decoding it, reading it in binary chunks
+    """
+    lines = 0
+    last_chunk = b""
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            lines += chunk.count(b"\n")
+            last_chunk = chunk
+    if last_chunk and not last_chunk.endswith(b"\n"):
+        lines += 1
+    return lines
+
+
+class SaveOptions:
+    def __init__(self, output_format=TEXT_FORMAT, archive=ARCHIVE_NONE, workers=1,
+                 compression=st.COMPRESSION_NONE, compression_level=6, pipeline=False):
+        """
+        workers > 1 decodes and writes measurements from a file in that many processes,
+        compression (see storage.COMPRESSIONS) is applied to every file or to every record of an archive,
+        pipeline reads, decodes and writes measurements in three threads at once (if workers is 1)
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise st.StorageError(f"unknown output format '{output_format}'")
+        if archive not in ARCHIVE_MODES:
+            raise st.StorageError(f"unknown archive mode '{archive}'")
+        if workers < 1:
+            raise st.StorageError(f"number of workers must be at least 1, not {workers}")
+        if compression not in st.COMPRESSIONS:
+            raise st.StorageError(f"unknown compression '{compression}'")
+        if not 0 <= compression_level <= 9:
+            raise st.StorageError(f"compression level must be in range 0-9, not {compression_level}")
+        self.output_format = output_format
+        self.archive = archive
+        self.workers = workers
+        self.compression = compression
+        self.compression_level = compression_level
+        self.pipeline = pipeline
+
+    def encode(self, measurement):
+        """
+        returns the measurement as bytes in the output format
+        """
+        if self.output_format == TEXT_FORMAT:
+            return str(measurement).encode()
+        return st.encode_measurement(measurement, self.output_format)
+
+    def compress(self, data):
+        return st.compress(data, self.compression, self.compression_level)
+
+    def is_compressed(self):
+        return self.compression != st.COMPRESSION_NONE
+
+
+class SaveStats:
+    """
+    bytes of encoded measurements and bytes actually written, for the compression ratio and throughput
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.raw_bytes = 0
+        self.written_bytes = 0
+
+    def add(self, raw_bytes, written_bytes):
+        self.raw_bytes += raw_bytes
+        self.written_bytes += written_bytes
+
+    def __str__(self):
+        ratio = self.raw_bytes / self.written_bytes if self.written_bytes else 0
+        throughput = self.raw_bytes / max(time.time() - self.started, 1e-6) / 1e6
+        return f"{ratio:.1f}x, {throughput:.1f} MB/s"
+
+
+def save_chunk(measurements, start, end, first_index, path, options, stamp):
+    """
+    runs in a worker process, decodes measurements from bytes start to end of the file. Measurements are
+    written into their own files or, in archive modes, returned as (channel, us, record) for the parent
+    process to append them in order. Returns (count, raw bytes, written bytes, records)
+    """
+    records = []
+    count = raw_bytes = written_bytes = 0
+    for i, measurement in enumerate(measurements.parse_file(start, end, first_index), first_index):
+        if options.archive == ARCHIVE_NONE:
+            raw, written = measurements.write_measurement(path, measurement, options, measurements.FileName(
+                measurement.channel, measurements.get_extension(options), i, stamp))
+        else:
+            record, raw = measurements.encode_measurement(measurement, options)
+            records.append((measurement.channel, measurement.us, record))
+            written = len(record)
+        raw_bytes += raw
+        written_bytes += written
+        count += 1
+    return count, raw_bytes, written_bytes, records
 
 
 class Measurements:
     measurements = None
+    lines_per_measurement = 1
+    # number of measurements decoded by one task of a worker process
+    chunk_size = 256
+    # maximum number of measurements waiting between stages of the pipeline
+    pipeline_queue_size = 32
+    pipeline = None
 
-    def __init__(self, file_path, channels, reinterpret_trimmed_data, saving_gui_text: sg.Text):
+    def __init__(self, file_path, channels, reinterpret_trimmed_data, saving_gui_text):
+        """
+        saving_gui_text shows the progress, it can be anything with update(value=...) like sg.Text
+        """
         self.file_path = file_path
         self.channels = channels
         self.reinterpret_trimmed_data = reinterpret_trimmed_data
         self.saving_gui_text = saving_gui_text
+
+    def __getstate__(self):
+        # gui elements can't be sent to worker processes
+        state = self.__dict__.copy()
+        state["saving_gui_text"] = None
+        return state
     
     class FileName:
-        def __init__(self, channel):
+        def __init__(self, channel, extension=".txt", index=None, stamp=None):
+            """
+            if index is given, the name is made of stamp (time when saving started) and the index
+            of the measurement, so it doesn't depend on when or by which process the file is written
+            """
             self.channel = channel
-            self.extension = ".txt"
+            self.extension = extension
+            self.index = index
+            self.stamp = stamp
 
         def __str__(self):
+            if self.index is not None:
+                return f"{self.stamp}_{self.index:07}_ch{self.channel}{self.extension}"
             now = datetime.now().strftime("%d-%m-%Y_%H-%M-%S-%f")
             return f"{now}_ch{self.channel}{self.extension}"
 
-    def save_to_disk(self, path):
+    def iter_measurements(self):
+        """
+        yields measurements one by one, subclasses parsing a file yield each one as soon as it's decoded
+        """
+        if self.measurements is None:
+            return self.parse_file()
+        return iter(self.measurements)
+
+    def count_measurements(self):
+        if self.measurements is None:
+            return count_lines(self.file_path) // self.lines_per_measurement
+        return len(self.measurements)
+
+    def save_to_disk(self, path, options=None):
+        """
+        writes every measurement into its own file (or appends it to an archive, see SaveOptions),
+        only one measurement is held in memory at a time. Binary formats are written into .bin files
+        """
+        options = options or SaveOptions()
         try:
             os.makedirs(path)
         except FileExistsError:
             pass
 
-        for i, measurement in enumerate(self.measurements):
-            file = self.FileName(measurement.channel)
-            with open(os.path.join(path, str(file)), "w") as f:
-                f.write(str(measurement))
-            self.saving_gui_text.update(value=f"Saving {i}/{len(self.measurements)}")
+        if options.workers > 1 and self.measurements is None:
+            self.save_to_disk_parallel(path, options)
+            return
+        if options.pipeline:
+            self.save_to_disk_pipelined(path, options)
+            return
+
+        archives = {}
+        stats = SaveStats()
+        number_of_measurements = self.count_measurements()
+        try:
+            for i, measurement in enumerate(self.iter_measurements()):
+                if options.archive != ARCHIVE_NONE:
+                    archive = self.get_archive(archives, path, measurement.channel, options)
+                    record, raw_bytes = self.encode_measurement(measurement, options)
+                    archive.append(record, measurement.channel, measurement.us)
+                    stats.add(raw_bytes, len(record))
+                else:
+                    file = self.FileName(measurement.channel, self.get_extension(options))
+                    stats.add(*self.write_measurement(path, measurement, options, file))
+                self.saving_gui_text.update(value=self.progress_text(i, number_of_measurements, options, stats))
+        finally:
+            for archive in archives.values():
+                archive.close()
+
+    def save_to_disk_parallel(self, path, options):
+        """
+        splits the file into chunks of whole measurements and decodes them in a process pool. Chunks are
+        collected in order and at most two per worker are in flight, so memory stays bounded
+        """
+        self.saving_gui_text.update(value="Reading temp.txt")
+        chunks = self.split_file()
+        number_of_measurements = chunks[-1][1] if chunks else 0
+        stamp = datetime.now().strftime("%d-%m-%Y_%H-%M-%S-%f")
+        archives = {}
+        stats = SaveStats()
+        saved = 0
+        try:
+            with ProcessPoolExecutor(max_workers=options.workers) as executor:
+                pending = deque()
+                for (start, first_index), (end, _) in zip(chunks, chunks[1:]):
+                    pending.append(executor.submit(save_chunk, self, start, end, first_index, path, options, stamp))
+                    if len(pending) < 2 * options.workers:
+                        continue
+                    saved = self.collect_chunk(pending.popleft(), archives, path, options, saved, stats)
+                    self.saving_gui_text.update(value=self.progress_text(saved, number_of_measurements, options, stats))
+                while pending:
+                    saved = self.collect_chunk(pending.popleft(), archives, path, options, saved, stats)
+                    self.saving_gui_text.update(value=self.progress_text(saved, number_of_measurements, options, stats))
+        finally:
+            for archive in archives.values():
+                archive.close()
+
+    def save_to_disk_pipelined(self, path, options):
+        """
+        reads, decodes and writes measurements in three threads connected by bounded queues, so decoding
+        doesn't wait for the disk and the other way round. self.pipeline has throughput of each stage
+        and depths of the queues
+        """
+        archives = {}
+        stats = SaveStats()
+        number_of_measurements = self.count_measurements()
+        measurements = self.iter_measurements()
+
+        def read(_):
+            return next(measurements, PipelineStage.END)
+
+        def decode(measurement):
+            return measurement.channel, measurement.us, *self.encode_measurement(measurement, options)
+
+        def write(item):
+            channel, us, data, raw_bytes = item
+            if options.archive != ARCHIVE_NONE:
+                self.get_archive(archives, path, channel, options).append(data, channel, us)
+            else:
+                self.write_file(path, self.FileName(channel, self.get_extension(options)), data)
+            stats.add(raw_bytes, len(data))
+            saved = write_stage.items
+            self.saving_gui_text.update(
+                value=f"{self.progress_text(saved, number_of_measurements, options, stats)} [{self.pipeline}]"
+            )
+
+        read_stage = PipelineStage("read", read, maxsize=self.pipeline_queue_size)
+        decode_stage = PipelineStage("decode", decode, read_stage, self.pipeline_queue_size)
+        write_stage = PipelineStage("write", write, decode_stage, last=True)
+        self.pipeline = Pipeline(read_stage, decode_stage, write_stage)
+        try:
+            self.pipeline.run()
+        finally:
+            for archive in archives.values():
+                archive.close()
+
+    def collect_chunk(self, future, archives, path, options, saved, stats):
+        count, raw_bytes, written_bytes, records = future.result()
+        for channel, us, record in records:
+            self.get_archive(archives, path, channel, options).append(record, channel, us)
+        stats.add(raw_bytes, written_bytes)
+        return saved + count
+
+    def progress_text(self, saved, number_of_measurements, options, stats):
+        if options.is_compressed():
+            return f"Saving {saved}/{number_of_measurements} ({stats})"
+        return f"Saving {saved}/{number_of_measurements}"
+
+    def split_file(self):
+        """
+        returns a list of (byte offset, index of the first measurement) of chunks of chunk_size measurements,
+        the last item is the end of the file and the number of measurements
+        """
+        with self.open_capture() as capture:
+            indices = list(range(0, len(capture), self.chunk_size)) + [len(capture)]
+            return [(int(capture.offsets[i]), i) for i in indices]
+
+    def get_extension(self, options):
+        extension = ".txt" if options.output_format == TEXT_FORMAT else ".bin"
+        return extension + st.COMPRESSION_EXTENSIONS[options.compression]
+
+    def write_measurement(self, path, measurement, options, file):
+        """
+        writes the measurement into its own file, returns (bytes of the encoded measurement, bytes written)
+        """
+        data, raw_bytes = self.encode_measurement(measurement, options)
+        self.write_file(path, file, data)
+        return raw_bytes, len(data)
+
+    def encode_measurement(self, measurement, options):
+        """
+        returns (data, length of the encoded measurement), data are compressed bytes, or str for uncompressed
+        text files, which are written in text mode
+        """
+        if options.output_format == TEXT_FORMAT and not options.is_compressed() and options.archive == ARCHIVE_NONE:
+            text = str(measurement)
+            return text, len(text)
+        record = options.encode(measurement)
+        return options.compress(record), len(record)
+
+    def write_file(self, path, file, data):
+        with open(os.path.join(path, str(file)), "w" if isinstance(data, str) else "wb") as f:
+            f.write(data)
+
+    def get_archive(self, archives, path, channel, options):
+        """
+        returns the archive the measurement from channel belongs to, opens it if needed
+        """
+        key = self.channels if options.archive == ARCHIVE_RUN else channel
+        if key not in archives:
+            file = self.FileName(key, ".osca")
+            archives[key] = st.ArchiveWriter(os.path.join(path, str(file)), options.output_format)
+        return archives[key]
+
+    def read_lines(self, start=0, end=None):
+        """
+        yields decoded lines of the file between byte offsets start and end
+        """
+        with open(self.file_path, "rb") as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if end is not None and offset >= end:
+                    return
+                offset += len(line)
+                yield line.decode()
+
+    def get_measurement(self, capture: CaptureFile, i):
+        """
+        returns the i-th measurement of the file as a LazyMeasurement without reading the rest of it,
+        capture should be opened with open_capture
+        """
+        preamble, line = capture.record(i)
+        us, data = self.get_us_and_data(line.decode())
+        measurement = LazyMeasurement(self.get_preamble(preamble, i), data, capture.channel(i),
+                                      self.reinterpret_trimmed_data)
+        measurement.append_us_to_preamble(us)
+        return measurement
+
+    def open_capture(self):
+        return CaptureFile(self.file_path, self.channels, self.lines_per_measurement)
 
     def get_us_and_data(self, line):
         first_space = line.index(" ")
@@ -126,70 +585,85 @@ class Measurements:
 
 
 class SingleMeasurements(Measurements):
-    def __init__(self, measurements, saving_gui_text: sg.Text):
+    def __init__(self, measurements, saving_gui_text, channels=None):
+        """
+        measurements is a list or an iterator yielding them while they're transferred, channels
+        (e.g. "23") have to be given for an iterator
+        """
         self.measurements = measurements
+        if channels is None:
+            channels = "".join(measurement.channel for measurement in measurements)
+        self.channels = channels
         self.saving_gui_text = saving_gui_text
 
+    def count_measurements(self):
+        return len(self.channels)
+
 
 
 class MultipleMeasurementsNoPreambles(Measurements):
 
-    def __init__(self, file_path, preambles, channels, reinterpret_trimmed_data, saving_gui_text: sg.Text):
+    def __init__(self, file_path, preambles, channels, reinterpret_trimmed_data, saving_gui_text):
         """
         channels should be string, e.g. "23"
         """
         super().__init__(file_path, channels, reinterpret_trimmed_data, saving_gui_text)
         self.preambles = preambles
-        self.measurements = self.parse_file()
 
-    def parse_file(self):
-        measurements = []
+    def get_preamble(self, preamble, i):
+        return self.preambles[i % len(self.channels)]
 
-        with open(self.file_path, "r") as f:
+    def parse_file(self, start=0, end=None, first_index=0):
+        """
+        generator yielding one measurement per line of the file, start and end are byte offsets
+        and first_index is the index of the measurement at start
+        """
+        if self.saving_gui_text is not None:
             self.saving_gui_text.update(value="Reading temp.txt")
-            for i, line in enumerate(f):
-                us, data = self.get_us_and_data(line)
-                measurement = Measurement(
-                    self.preambles[i % len(self.channels)],
-                    data,
-                    self.channels[i % len(self.channels)],
-                    self.reinterpret_trimmed_data,
-                )
-                measurement.append_us_to_preamble(us)
-                measurements.append(measurement)
-
-        return measurements
+        for i, line in enumerate(self.read_lines(start, end), first_index):
+            us, data = self.get_us_and_data(line)
+            measurement = LazyMeasurement(
+                self.preambles[i % len(self.channels)],
+                data,
+                self.channels[i % len(self.channels)],
+                self.reinterpret_trimmed_data,
+            )
+            measurement.append_us_to_preamble(us)
+            yield measurement
 
 
 class MultipleMeasurementsWithPreambles(Measurements):
+    lines_per_measurement = 2
 
-    def __init__(self, file_path, channels, reinterpret_trimmed_data, saving_gui_text: sg.Text):
+    def __init__(self, file_path, channels, reinterpret_trimmed_data, saving_gui_text):
         """
         channels should be string, e.g. "23"
         """
         super().__init__(file_path, channels, reinterpret_trimmed_data, saving_gui_text)
-        self.measurements = self.parse_file()
 
-    def parse_file(self):
-        measurements = []
+    def get_preamble(self, preamble, i):
+        return preamble.decode()
 
-        with open(self.file_path, "r") as f:
+    def parse_file(self, start=0, end=None, first_index=0):
+        """
+        generator yielding one measurement per preamble line and data line pair of the file,
+        start and end are byte offsets and first_index is the index of the measurement at start
+        """
+        if self.saving_gui_text is not None:
             self.saving_gui_text.update(value="Reading temp.txt")
-            preamble = None
-            channel_index = 0
-            for i, line in enumerate(f):
-                if i % 2 == 0:
-                    preamble = line.strip()
-                    continue
-                us, data = self.get_us_and_data(line)
-                measurement = Measurement(
-                    preamble, data, self.channels[channel_index], self.reinterpret_trimmed_data
-                )
-                measurement.append_us_to_preamble(us)
-                measurements.append(measurement)
-                if channel_index > len(self.channels) - 2:
-                    channel_index = 0
-                else:
-                    channel_index += 1
-
-        return measurements
+        preamble = None
+        channel_index = first_index % len(self.channels)
+        for i, line in enumerate(self.read_lines(start, end)):
+            if i % 2 == 0:
+                preamble = line.strip()
+                continue
+            us, data = self.get_us_and_data(line)
+            measurement = LazyMeasurement(
+                preamble, data, self.channels[channel_index], self.reinterpret_trimmed_data
+            )
+            measurement.append_us_to_preamble(us)
+            yield measurement
+            if channel_index > len(self.channels) - 2:
+                channel_index = 0
+            else:
+                channel_index += 1
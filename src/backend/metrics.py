@@ -0,0 +1,157 @@
+import csv
+import json
+import threading
+import time
+
+
+class Histogram:
+    """
+    counts of integer values (microseconds or bytes) in power of two buckets, bucket i holds
+    values v with v.bit_length() == i, i.e. 2^(i-1) <= v < 2^i
+    """
+    size = 64
+
+    def __init__(self):
+        self.buckets = [0] * self.size
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        value = max(int(value), 0)
+        self.buckets[min(value.bit_length(), self.size - 1)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def percentile(self, p):
+        """
+        returns the upper bound of the bucket with the p-th percentile (0-100), at most the maximum
+        """
+        if not self.count:
+            return 0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(2 ** i - 1, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            "buckets": {2 ** i - 1: count for i, count in enumerate(self.buckets) if count},
+        }
+
+
+class Metrics:
+    """
+    histograms of hpctrl command timings keyed by command verb (e.g. "q :acquire:points" or "16").
+    Adapter records the time to write a command (including not-ready retries), the time from the write
+    to the first output line, the total time until the response is complete and the bytes received
+    """
+    quantities = {
+        "write": "us",
+        "first_line": "us",
+        "total": "us",
+        "bytes": "B",
+    }
+    summary_percentiles = (50, 90, 99)
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    @staticmethod
+    def verb(message):
+        """
+        returns the command without its argument, lower case
+        """
+        words = message.lower().split()
+        if not words:
+            return ""
+        if words[0] in ("q", "s") and len(words) > 1:
+            return f"{words[0]} {words[1].rstrip('?')}"
+        return words[0]
+
+    def record(self, verb, **values):
+        """
+        adds values of quantities, times are in seconds, bytes as they are
+        """
+        with self.lock:
+            for quantity, value in values.items():
+                if value is None:
+                    continue
+                if self.quantities[quantity] == "us":
+                    value *= 1e6
+                key = (verb, quantity)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram()
+                self.histograms[key].add(value)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.started = time.time()
+
+    def rows(self):
+        """
+        returns summary rows: verb, quantity, unit, count, mean, percentiles and max
+        """
+        with self.lock:
+            items = sorted(self.histograms.items())
+            return [
+                [verb, quantity, self.quantities[quantity], histogram.count, round(histogram.mean()),
+                 *(histogram.percentile(p) for p in self.summary_percentiles), histogram.max]
+                for (verb, quantity), histogram in items
+            ]
+
+    def header(self):
+        return ["verb", "quantity", "unit", "count", "mean", *(f"p{p}" for p in self.summary_percentiles), "max"]
+
+    def __str__(self):
+        rows = self.rows()
+        if not rows:
+            return "no commands recorded"
+        table = [self.header()] + [[str(value) for value in row] for row in rows]
+        widths = [max(len(row[i]) for row in table) for i in range(len(table[0]))]
+        return "\n".join("  ".join(value.ljust(width) for value, width in zip(row, widths)) for row in table)
+
+    def export_json(self, path):
+        with self.lock:
+            histograms = {}
+            for (verb, quantity), histogram in sorted(self.histograms.items()):
+                histograms.setdefault(verb, {})[quantity] = dict(histogram.as_dict(), unit=self.quantities[quantity])
+        with open(path, "w") as f:
+            json.dump({"started": self.started, "commands": histograms}, f, indent=2)
+
+    def export_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.header())
+            writer.writerows(self.rows())
+
+
+class CaptureMetrics(Metrics):
+    """
+    histograms of timings of repeated captures keyed by mode (e.g. "single"): total time of a capture,
+    time busy transferring, decoding and writing measurements and lag, how late the capture started
+    after its scheduled time
+    """
+    quantities = {
+        "total": "us",
+        "transfer": "us",
+        "decode": "us",
+        "write": "us",
+        "lag": "us",
+    }
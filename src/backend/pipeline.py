@@ -0,0 +1,102 @@
+import queue
+import threading
+import time
+
+
+class PipelineStage:
+    """
+    one thread of a staged pipeline. It takes items from the queue of the previous stage (the first stage
+    has no source and its work produces the items), applies work to them and puts the results into its own
+    bounded queue, so a slow stage throttles the stages before it instead of growing memory.
+    Time spent waiting on queues isn't counted as busy, items / busy is how fast the stage could go alone
+    """
+    END = object()
+    # seconds between checks whether the pipeline was stopped while waiting on a queue
+    poll_interval = 0.1
+
+    def __init__(self, name, work, source=None, maxsize=0, last=False):
+        self.name = name
+        self.work = work
+        self.source = source
+        self.queue = None if last else queue.Queue(maxsize)
+        self.items = 0
+        self.busy = 0.0
+        self.max_depth = 0
+        self.error = None
+        self.thread = None
+
+    def start(self, stop):
+        self.thread = threading.Thread(target=self.run, args=(stop,), daemon=True)
+        self.thread.start()
+
+    def inputs(self, stop):
+        if self.source is None:
+            while not stop.is_set():
+                yield None
+            return
+        while not stop.is_set():
+            try:
+                item = self.source.queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+            if item is self.END:
+                return
+            yield item
+
+    def put(self, item, stop):
+        while not stop.is_set():
+            try:
+                self.queue.put(item, timeout=self.poll_interval)
+                self.max_depth = max(self.max_depth, self.queue.qsize())
+                return
+            except queue.Full:
+                continue
+
+    def run(self, stop):
+        try:
+            for item in self.inputs(stop):
+                started = time.perf_counter()
+                result = self.work(item)
+                self.busy += time.perf_counter() - started
+                if result is self.END:
+                    break
+                self.items += 1
+                if self.queue is not None:
+                    self.put(result, stop)
+        except Exception as error:
+            self.error = error
+            stop.set()
+        finally:
+            if self.queue is not None:
+                self.put(self.END, stop)
+
+    def __str__(self):
+        rate = self.items / self.busy if self.busy else 0
+        if self.queue is None:
+            return f"{self.name} {rate:.0f}/s"
+        return f"{self.name} {rate:.0f}/s q{self.queue.qsize()}/{self.queue.maxsize}"
+
+
+class Pipeline:
+    """
+    stages connected one after another, see PipelineStage
+    """
+
+    def __init__(self, *stages):
+        self.stages = stages
+        self.stop = threading.Event()
+
+    def run(self):
+        """
+        runs all stages and waits for them, raises the first error of a stage
+        """
+        for stage in self.stages:
+            stage.start(self.stop)
+        for stage in self.stages:
+            stage.thread.join()
+        for stage in self.stages:
+            if stage.error is not None:
+                raise stage.error
+
+    def __str__(self):
+        return ", ".join(str(stage) for stage in self.stages)
@@ -0,0 +1,104 @@
+import contextlib
+import threading
+from backend.adapter import Adapter
+from backend.state import InstrumentState
+
+
+class Instrument:
+    """
+    handle of one oscilloscope: its GPIB address, its own hpctrl adapter and cached state
+    """
+
+    def __init__(self, address, adapter):
+        self.address = address
+        self.adapter = adapter
+        self.state = InstrumentState()
+
+    def __str__(self):
+        return f"gpib{self.address}"
+
+
+selected = threading.local()
+
+
+def selected_instrument():
+    """
+    returns the instrument selected in this thread or None, commands then use the default adapter
+    """
+    return getattr(selected, "instrument", None)
+
+
+@contextlib.contextmanager
+def select(instrument):
+    """
+    routes commands sent by this thread to the instrument (None for the default adapter)
+    """
+    previous = selected_instrument()
+    selected.instrument = instrument
+    try:
+        yield instrument
+    finally:
+        selected.instrument = previous
+
+
+class AdapterPool:
+    """
+    one hpctrl process per GPIB address, so several oscilloscopes can be driven at once.
+    Adapters are created when an address is first used
+    """
+
+    def __init__(self, testing):
+        self.testing = testing
+        self.instruments = {}
+        self.lock = threading.Lock()
+
+    def get(self, address):
+        """
+        returns the instrument with the address, raises AdapterError if hpctrl can't be found
+        """
+        address = str(address)
+        with self.lock:
+            if address not in self.instruments:
+                self.instruments[address] = Instrument(address, Adapter(self.testing))
+            return self.instruments[address]
+
+    def remove(self, address):
+        """
+        forgets the instrument, its hpctrl should be stopped already
+        """
+        with self.lock:
+            self.instruments.pop(str(address), None)
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.instruments.values()))
+
+    def __len__(self):
+        return len(self.instruments)
+
+    def run_each(self, addresses, work):
+        """
+        calls work(instrument) for every address at once, each in its own thread with the instrument
+        selected. Returns the results in the order of addresses, the first error is raised after all finish
+        """
+        instruments = [self.get(address) for address in addresses]
+        results = [None] * len(instruments)
+        errors = [None] * len(instruments)
+
+        def run(i, instrument):
+            with select(instrument):
+                try:
+                    results[i] = work(instrument)
+                except Exception as error:
+                    errors[i] = error
+
+        threads = [threading.Thread(target=run, args=(i, instrument), daemon=True)
+                   for i, instrument in enumerate(instruments)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for error in errors:
+            if error is not None:
+                raise error
+        return results
@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+import numpy as np
+import backend.measurement as ms
+from backend.ingest import RunIngest
+
+
+class MeasurementRing:
+    """
+    the last capacity measurements of one channel. Words are kept in one preallocated int16 array
+    (capacity x points), a new measurement overwrites the oldest one when the ring is full. It's allocated
+    with the first measurement and again if the number of points changes
+    """
+
+    def __init__(self, channel, capacity):
+        self.channel = channel
+        self.capacity = capacity
+        self.words = None
+        # order of the measurement in the run, its microseconds from the first measurement and its preamble
+        self.indices = np.zeros(capacity, dtype=np.int64)
+        self.us = np.zeros(capacity, dtype=np.float64)
+        self.stamps = [None] * capacity
+        self.preambles = [None] * capacity
+        self.start = 0
+        self.count = 0
+
+    def push(self, measurement, index):
+        words = measurement.words
+        if self.words is None or self.words.shape[1] != len(words):
+            self.words = np.empty((self.capacity, len(words)), dtype=np.int16)
+            self.clear()
+        if self.count < self.capacity:
+            i = (self.start + self.count) % self.capacity
+            self.count += 1
+        else:
+            i = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.words[i] = words
+        self.indices[i] = index
+        self.us[i] = float(measurement.us) if measurement.us is not None else np.nan
+        self.stamps[i] = measurement.us
+        self.preambles[i] = measurement.preamble
+
+    def clear(self):
+        self.start = 0
+        self.count = 0
+
+    def slots(self):
+        return [(self.start + i) % self.capacity for i in range(self.count)]
+
+    def newest_us(self):
+        if not self.count:
+            return np.nan
+        return self.us[(self.start + self.count - 1) % self.capacity]
+
+    def measurement(self, slot, reinterpret_trimmed_data):
+        """
+        returns the measurement in the slot, its words are copied so the ring can be overwritten
+        """
+        measurement = ms.LazyMeasurement(self.preambles[slot], self.words[slot].copy(), self.channel,
+                                         reinterpret_trimmed_data)
+        measurement.append_us_to_preamble(self.stamps[slot])
+        return measurement
+
+
+class RunRing(RunIngest):
+    """
+    rolling retention of a long RUN: measurements are taken from the file while it's written (see RunIngest)
+    and only the last ones of every channel are kept in MeasurementRing. Measurements of the last seconds
+    before STOP are saved into path. If trigger_level (in Y units, e.g. volts) is given, the last seconds
+    before a measurement reaching it are saved right away into a folder triggerNNN in path, the next trigger
+    needs a measurement of the channel below the level first.
+    Every segment_seconds, restart(ring) stops the RUN, waits for hpctrl to write the file, calls next_file,
+    removes the file and starts the RUN again (see backend.command.restart_run_segment). hpctrl's buffer and
+    the file then hold one segment at most, so neither the limits of hpctrl.cfg nor the disk end a long RUN.
+    hpctrl writes the file at STOP, so triggers are found at the end of their segment
+    """
+
+    def __init__(self, measurements, path, options=None, seconds=10, capacity=1024, trigger_level=None,
+                 segment_seconds=0, restart=None):
+        self.seconds = seconds
+        self.trigger_level = trigger_level
+        self.rings = {channel: MeasurementRing(channel, capacity) for channel in measurements.channels}
+        self.triggers = 0
+        # a trigger fires when a measurement reaches the level after one of its channel that didn't
+        self.armed = {channel: True for channel in measurements.channels}
+        self.segment_seconds = segment_seconds
+        self.restart = restart
+        # hpctrl counts us stamps from the start of every segment, us_offset is the start of the current one
+        # from the start of the RUN
+        self.started = time.perf_counter()
+        self.us_offset = 0
+        self.segments = 0
+        super().__init__(measurements, path, options)
+        self.segment_thread = None
+        if segment_seconds and restart is not None:
+            self.segment_thread = threading.Thread(target=self.restart_segments, daemon=True)
+            self.segment_thread.start()
+
+    def restart_segments(self):
+        while not self.ending.wait(self.segment_seconds):
+            with self.switching:
+                if self.ending.is_set():
+                    return
+                try:
+                    self.restart(self)
+                except Exception as error:
+                    self.error = error
+                    return
+
+    def next_segment(self):
+        """
+        called right before the RUN is started again, stamps of the next file are counted from now
+        """
+        self.us_offset = round((time.perf_counter() - self.started) * 1e6)
+        self.segments += 1
+
+    def add(self, measurement):
+        if self.us_offset and measurement.us is not None:
+            measurement.append_us_to_preamble(str(round(float(measurement.us)) + self.us_offset))
+        self.rings[measurement.channel].push(measurement, self.ingested)
+        if self.trigger_level is None:
+            return
+        reached = bool(np.any(np.abs(measurement.data) >= self.trigger_level))
+        if reached and self.armed[measurement.channel]:
+            self.triggers += 1
+            self.save_window(os.path.join(self.path, f"trigger{self.triggers:03}"))
+            for ring in self.rings.values():
+                ring.clear()
+        self.armed[measurement.channel] = not reached
+
+    def save_rest(self):
+        self.save_window(self.path)
+
+    def window(self):
+        """
+        returns (ring, slot) of measurements of the last seconds in the order they were measured,
+        measurements without a time stamp are all in the window
+        """
+        newest = max((ring.newest_us() for ring in self.rings.values() if ring.count), default=np.nan)
+        slots = []
+        for ring in self.rings.values():
+            for slot in ring.slots():
+                if np.isnan(newest) or np.isnan(ring.us[slot]) or newest - self.seconds * 1e6 <= ring.us[slot] <= newest:
+                    slots.append((ring.indices[slot], ring, slot))
+        return [(ring, slot) for _, ring, slot in sorted(slots, key=lambda item: item[0])]
+
+    def save_window(self, path):
+        os.makedirs(path, exist_ok=True)
+        archives = {}
+        try:
+            for ring, slot in self.window():
+                self.save(ring.measurement(slot, self.measurements.reinterpret_trimmed_data), path, archives)
+        finally:
+            for archive in archives.values():
+                archive.close()
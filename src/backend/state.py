@@ -0,0 +1,122 @@
+import re
+import threading
+
+
+class InstrumentState:
+    """
+    cache of answers to queries of the oscilloscope settings. The settings change only by set commands
+    ("s <header> <value>") sent through the command layer, so an answer is valid until a set command of
+    the same header. on/off values are written through (the oscilloscope answers 1/0), other values
+    invalidate the answer. Set commands of headers that aren't cached (e.g. *RST or autoscale) may change
+    anything and clear the whole cache.
+    Answers of waveform queries (e.g. the preamble) depend on all settings and on the acquisition (date,
+    time, count), they are kept per waveform source and dropped by any other set command except the neutral
+    ones and by every new acquisition (SINGLE, RUN or a continuous read)
+    """
+    set_prefix = "s "
+    query_prefix = "q "
+    # settings answered from the cache
+    settings = re.compile(r":acquire:(points|count|average)|:channel\d:display|:waveform:(source|format)")
+    source = ":waveform:source"
+    waveform_queries = (":waveform:preamble",)
+    # set commands that don't change any setting
+    neutral = ("stop", ":waveform:data")
+    # set commands that start a new acquisition, settings stay but waveform answers are dropped
+    acquisitions = ("single", "run")
+    # hpctrl command starting a continuous read
+    continuous_read = "*"
+    switches = {"on": "1", "off": "0"}
+
+    def __init__(self):
+        self.answers = {}
+        self.set_values = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def header(command, prefix):
+        """
+        returns (header, value) of a set command or a query, headers are lower case without the ? of queries
+        """
+        header, _, value = command[len(prefix):].strip().partition(" ")
+        return header.lower().rstrip("?"), value.strip().lower()
+
+    def key(self, query):
+        """
+        returns the key of the query's answer or None if the answer can't be cached
+        """
+        if not query.lower().startswith(self.query_prefix):
+            return None
+        header, _ = self.header(query, self.query_prefix)
+        if self.settings.fullmatch(header):
+            return header
+        if header in self.waveform_queries and self.source in self.set_values:
+            return f"{header} {self.set_values[self.source]}"
+        return None
+
+    def answer(self, query):
+        """
+        returns the cached answer to the query or None
+        """
+        key = self.key(query)
+        with self.lock:
+            return self.answers.get(key) if key is not None else None
+
+    def store(self, query, answer):
+        key = self.key(query)
+        if key is not None:
+            with self.lock:
+                self.answers[key] = answer
+
+    def is_set(self, command):
+        """
+        returns True if the set command was the last one of its header, sending it again changes nothing
+        """
+        header, value = self.header(command, self.set_prefix)
+        with self.lock:
+            return self.settings.fullmatch(header) is not None and self.set_values.get(header) == value
+
+    def update(self, messages):
+        """
+        updates the cache with messages sent to hpctrl (list or lines of a str)
+        """
+        if not isinstance(messages, list):
+            messages = messages.split("\n")
+        for message in messages:
+            if message.lower().startswith(self.set_prefix):
+                self.set(*self.header(message, self.set_prefix))
+            elif message.strip() == self.continuous_read:
+                with self.lock:
+                    self.drop_waveform_answers()
+
+    def set(self, header, value):
+        with self.lock:
+            if header in self.neutral:
+                return
+            if header in self.acquisitions:
+                self.drop_waveform_answers()
+                return
+            if header == self.source:
+                self.set_values[header] = value
+                self.answers.pop(header, None)
+                return
+            if not self.settings.fullmatch(header):
+                self.answers.clear()
+                self.set_values.clear()
+                return
+            self.drop_waveform_answers()
+            self.answers.pop(header, None)
+            self.set_values[header] = value
+            if value in self.switches:
+                self.answers[header] = self.switches[value]
+
+    def drop_waveform_answers(self):
+        """
+        forgets answers of waveform queries of all sources, call with the lock held
+        """
+        self.answers = {key: answer for key, answer in self.answers.items()
+                        if key.split(" ")[0] not in self.waveform_queries}
+
+    def clear(self):
+        with self.lock:
+            self.answers.clear()
+            self.set_values.clear()
@@ -0,0 +1,285 @@
+import gzip
+import io
+import json
+import lzma
+import struct
+import numpy as np
+
+
+class StorageError(Exception):
+    pass
+
+
+MAGIC = b"OSCM"
+VERSION = 1
+# magic, version, header length
+PREFIX = struct.Struct("<4sHI")
+ALIGNMENT = 64
+SAMPLE_DTYPES = {
+    "int16": np.dtype("<i2"),
+    "float32": np.dtype("<f4"),
+}
+
+
+COMPRESSION_NONE = "none"
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_LZMA = "lzma"
+COMPRESSION_EXTENSIONS = {
+    COMPRESSION_NONE: "",
+    COMPRESSION_GZIP: ".gz",
+    COMPRESSION_LZMA: ".xz",
+}
+COMPRESSIONS = tuple(COMPRESSION_EXTENSIONS)
+GZIP_MAGIC = b"\x1f\x8b"
+LZMA_MAGIC = b"\xfd7zXZ\x00"
+
+
+def compress(data, compression, level):
+    """
+    compresses bytes with gzip (level 0-9) or lzma (preset 0-9), returns them as they are with COMPRESSION_NONE
+    """
+    if compression == COMPRESSION_GZIP:
+        return gzip.compress(data, compresslevel=level)
+    if compression == COMPRESSION_LZMA:
+        return lzma.compress(data, preset=level)
+    return data
+
+
+def decompress(data):
+    """
+    returns decompressed bytes if they start with the gzip or xz magic, otherwise returns them as they are
+    """
+    if data.startswith(GZIP_MAGIC):
+        return gzip.decompress(data)
+    if data.startswith(LZMA_MAGIC):
+        return lzma.decompress(data)
+    return data
+
+
+def open_file(path):
+    """
+    opens a saved file for reading in binary mode, gzip and xz compressed files are decompressed transparently
+    """
+    with open(path, "rb") as f:
+        magic = f.read(len(LZMA_MAGIC))
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(path, "rb")
+    if magic.startswith(LZMA_MAGIC):
+        return lzma.open(path, "rb")
+    return open(path, "rb")
+
+
+def encode_record(header, samples, sample_format):
+    """
+    returns the binary form of one measurement: a prefix, a JSON header padded so the samples are aligned
+    to ALIGNMENT bytes (the file can be memory-mapped) and the samples themselves
+    """
+    dtype = SAMPLE_DTYPES[sample_format]
+    header = dict(header, sample_format=sample_format, samples=len(samples))
+    header_bytes = json.dumps(header).encode()
+    padding = -(PREFIX.size + len(header_bytes) + 1) % ALIGNMENT
+    header_bytes += b" " * padding + b"\n"
+    return PREFIX.pack(MAGIC, VERSION, len(header_bytes)) + header_bytes + samples.astype(dtype, copy=False).tobytes()
+
+
+def measurement_header(measurement):
+    """
+    self-describing header of a measurement, the preamble is stored with its original field names and values
+    """
+    preamble = measurement.preamble
+    return {
+        "channel": measurement.channel,
+        "us": measurement.us,
+        "y_increment": preamble.y_increment,
+        "y_origin": preamble.y_origin,
+        "reinterpret_trimmed_data": measurement.reinterpret_trimmed_data,
+        "preamble": dict(zip(preamble.labels, preamble.values)),
+    }
+
+
+def encode_measurement(measurement, sample_format):
+    """
+    int16 stores the raw words from the oscilloscope (scale them with y_increment and y_origin),
+    float32 stores the already scaled values with NaN in place of holes
+    """
+    if sample_format == "int16":
+        samples = measurement.words
+    elif sample_format == "float32":
+        samples = measurement.data
+    else:
+        raise StorageError(f"unknown sample format '{sample_format}'")
+    return encode_record(measurement_header(measurement), samples, sample_format)
+
+
+def decode_prefix(prefix):
+    """
+    returns the header length from the fixed size prefix of a record
+    """
+    if len(prefix) < PREFIX.size:
+        raise StorageError("file is too short to be a binary measurement")
+    magic, version, header_length = PREFIX.unpack(prefix[:PREFIX.size])
+    if magic != MAGIC:
+        raise StorageError("not a binary measurement")
+    if version != VERSION:
+        raise StorageError(f"unsupported binary measurement version {version}")
+    return header_length
+
+
+def read_header(f):
+    """
+    reads the header of a record from an open binary file, returns (header, offset of the samples)
+    """
+    start = f.tell()
+    header_length = decode_prefix(f.read(PREFIX.size))
+    header = json.loads(f.read(header_length))
+    return header, start + PREFIX.size + header_length
+
+
+def load_record(path, mmap=True):
+    """
+    returns (header, samples), samples are memory-mapped read-only unless mmap is False
+    or the file is compressed
+    """
+    with open_file(path) as f:
+        header, offset = read_header(f)
+        dtype = SAMPLE_DTYPES[header["sample_format"]]
+        if not mmap or not isinstance(f, io.BufferedReader):
+            f.seek(offset)
+            return header, np.frombuffer(f.read(header["samples"] * dtype.itemsize), dtype=dtype)
+    if header["samples"] == 0:
+        return header, np.empty(0, dtype=dtype)
+    return header, np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(header["samples"],))
+
+
+ARCHIVE_MAGIC = b"OSCA"
+ARCHIVE_VERSION = 1
+# magic, version, format of the records (e.g. b"txt", b"int16")
+ARCHIVE_PREFIX = struct.Struct("<4sH10s")
+# marker, length of the record, channel, microseconds from the first measurement (-1 if unknown)
+ARCHIVE_FRAME = struct.Struct("<4sIBq")
+ARCHIVE_FRAME_MARKER = b"OSCR"
+# offset of the index, number of records, magic
+ARCHIVE_FOOTER = struct.Struct("<QQ4s")
+ARCHIVE_INDEX_DTYPE = np.dtype([("offset", "<u8"), ("length", "<u4"), ("channel", "u1"), ("us", "<i8")])
+
+
+def us_as_int(us):
+    try:
+        return int(us)
+    except (TypeError, ValueError):
+        return -1
+
+
+class ArchiveWriter:
+    """
+    appends records of a run into one file. Every record is framed with its length, channel and us stamp
+    and an index of record offsets is written at the end, so a single record can be read without scanning
+    the whole file
+    """
+
+    def __init__(self, path, record_format):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(ARCHIVE_PREFIX.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, record_format.encode()))
+        self.index = []
+
+    def append(self, record, channel, us):
+        offset = self.file.tell()
+        self.file.write(ARCHIVE_FRAME.pack(ARCHIVE_FRAME_MARKER, len(record), int(channel), us_as_int(us)))
+        self.file.write(record)
+        self.index.append((offset + ARCHIVE_FRAME.size, len(record), int(channel), us_as_int(us)))
+
+    def close(self):
+        if self.file.closed:
+            return
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.index, dtype=ARCHIVE_INDEX_DTYPE).tobytes())
+        self.file.write(ARCHIVE_FOOTER.pack(index_offset, len(self.index), ARCHIVE_MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ArchiveReader:
+    """
+    random access to the records of an archive written by ArchiveWriter. If the archive wasn't closed
+    properly (the index is missing), the index is rebuilt by walking the record frames
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        magic, version, record_format = ARCHIVE_PREFIX.unpack(self.file.read(ARCHIVE_PREFIX.size))
+        if magic != ARCHIVE_MAGIC:
+            self.file.close()
+            raise StorageError(f"{path} is not an archive")
+        if version != ARCHIVE_VERSION:
+            self.file.close()
+            raise StorageError(f"unsupported archive version {version}")
+        self.record_format = record_format.rstrip(b"\0").decode()
+        self.index = self.read_index()
+
+    def read_index(self):
+        self.file.seek(0, 2)
+        size = self.file.tell()
+        if size >= ARCHIVE_PREFIX.size + ARCHIVE_FOOTER.size:
+            self.file.seek(size - ARCHIVE_FOOTER.size)
+            index_offset, count, magic = ARCHIVE_FOOTER.unpack(self.file.read(ARCHIVE_FOOTER.size))
+            if magic == ARCHIVE_MAGIC and index_offset + count * ARCHIVE_INDEX_DTYPE.itemsize + ARCHIVE_FOOTER.size == size:
+                self.file.seek(index_offset)
+                return np.frombuffer(self.file.read(count * ARCHIVE_INDEX_DTYPE.itemsize), dtype=ARCHIVE_INDEX_DTYPE)
+        return self.scan_index(size)
+
+    def scan_index(self, size):
+        index = []
+        offset = ARCHIVE_PREFIX.size
+        while offset + ARCHIVE_FRAME.size <= size:
+            self.file.seek(offset)
+            marker, length, channel, us = ARCHIVE_FRAME.unpack(self.file.read(ARCHIVE_FRAME.size))
+            if marker != ARCHIVE_FRAME_MARKER or offset + ARCHIVE_FRAME.size + length > size:
+                break
+            index.append((offset + ARCHIVE_FRAME.size, length, channel, us))
+            offset += ARCHIVE_FRAME.size + length
+        return np.array(index, dtype=ARCHIVE_INDEX_DTYPE)
+
+    def __len__(self):
+        return len(self.index)
+
+    def channel(self, i):
+        return str(self.index[i]["channel"])
+
+    def us(self, i):
+        return int(self.index[i]["us"])
+
+    def record(self, i):
+        """
+        returns the bytes of the i-th record, decompressed if it was compressed
+        """
+        entry = self.index[i]
+        self.file.seek(int(entry["offset"]))
+        return decompress(self.file.read(int(entry["length"])))
+
+    def load(self, i):
+        """
+        returns (header, samples) of the i-th record of an archive with binary records
+        """
+        if self.record_format not in SAMPLE_DTYPES:
+            raise StorageError(f"records in {self.path} are not binary measurements")
+        record = self.record(i)
+        header_length = decode_prefix(record)
+        start = PREFIX.size + header_length
+        header = json.loads(record[PREFIX.size:start])
+        return header, np.frombuffer(record, dtype=SAMPLE_DTYPES[header["sample_format"]], offset=start)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
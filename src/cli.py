@@ -0,0 +1,306 @@
+"""
+headless acquisition without the GUI (PySimpleGUI isn't imported). Connects once, applies a config file
+and settings, runs repeated SINGLE or timed RUN captures on the same hpctrl session and prints progress
+as JSON lines on stdout. Launch it from the root folder like the GUI:
+
+python src/cli.py --address 7 --channels 1,3 single --count 10 --interval 60
+python src/cli.py --address 7 run --duration 30 --count 4
+python src/cli.py --address 7 serve
+python src/cli.py --address 7 --address 8 single --count 10 --interval 60
+
+serve reads commands from stdin, one per line: single, run <seconds>, config <file> [inputs...],
+send <command>, query <command> and exit. With several --address, every oscilloscope has its own hpctrl,
+commands go to all of them at once and measurements are saved into a folder of each (e.g. gpib7)
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import multiprocessing
+from dotenv import load_dotenv
+
+ENV_PATH = ".env"
+# seconds between checks for errors from hpctrl during RUN
+RUN_POLL_INTERVAL = 0.5
+
+
+def emit(event, **values):
+    """
+    prints one progress event as a JSON line
+    """
+    print(json.dumps(dict(event=event, time=round(time.time(), 3), **values)), flush=True)
+
+
+class ProgressText:
+    """
+    stands for the saving text and run button of the GUI, updates become progress events
+    """
+
+    def update(self, value=None, **kwargs):
+        if value is not None:
+            emit("progress", text=value)
+
+    def Update(self, *args, **kwargs):
+        pass
+
+
+def channel_keys(channels):
+    return [f"ch{channel}" for channel in channels]
+
+
+def channels_arg(value):
+    """
+    parses comma-separated channels, e.g. 1,3
+    """
+    channels = value.split(",")
+    for channel in channels:
+        if channel not in "1234" or len(channel) != 1:
+            raise argparse.ArgumentTypeError(f"invalid channel '{channel}' (choose from 1, 2, 3, 4)")
+    return channels
+
+
+def on_each(cm, args, work):
+    """
+    calls work(address) for every address with its instrument selected, at once if there are several
+    (see backend.pool.AdapterPool.run_each). One address uses the default adapter. Returns the results
+    """
+    if len(args.address) == 1:
+        return [work(args.address[0])]
+    return cm.pool.run_each(args.address, lambda instrument: work(instrument.address))
+
+
+def instrument(cm, args, address):
+    """
+    returns the instrument with the address, None (the default adapter) if it's the only one
+    """
+    return None if len(args.address) == 1 else cm.pool.get(address)
+
+
+def instrument_file(cm, args, file, address):
+    return file if len(args.address) == 1 else cm.instrument_file(file, cm.pool.get(address))
+
+
+def instrument_path(cm, args, address):
+    return args.path if len(args.address) == 1 else cm.instrument_path(args.path, cm.pool.get(address))
+
+
+def connect(cm, args):
+    on_each(cm, args, lambda address: connect_instrument(cm, args, address))
+
+
+def connect_instrument(cm, args, address):
+    cm.initialize_cmds(address)
+    emit("connected", address=address)
+    if args.config:
+        apply_config(cm, args.config, args.input, address)
+    if args.points:
+        cm.PointsCmd(args.points).check_and_do()
+    if args.average:
+        cm.AverageNoCmd(args.average).check_and_do()
+        cm.AverageCmd().do(True)
+    for channel in "1234":
+        if channel in args.channels:
+            cm.TurnOnChannelCmd(channel).do()
+        else:
+            cm.TurnOffChannelCmd(channel).do()
+    if args.preamble:
+        cm.PreambleOnCmd().do()
+    emit("ready", address=address, channels=args.channels, preamble=args.preamble)
+
+
+def apply_config(cm, path, inputs, address):
+    commands = cm.config_cmds(path, inputs)
+    for command in commands:
+        cm.CustomCmd(command).do()
+    emit("config", address=address, file=path, commands=commands)
+
+
+def rounded(timings):
+    return {name: round(seconds, 3) for name, seconds in timings.items()}
+
+
+def single(cm, args, index):
+    emit("capture", mode="single", index=index)
+    channels = channel_keys(args.channels)
+    if len(args.address) == 1:
+        results = [cm.single_cmds(channels, args.path, args.reinterpret, ProgressText())]
+    else:
+        results = cm.single_instruments_cmds(args.address, channels, args.path, args.reinterpret, ProgressText())
+    for address, timings in zip(args.address, results):
+        emit("saved", mode="single", index=index, address=address, path=instrument_path(cm, args, address),
+             seconds=round(timings["total"], 3), **rounded(timings))
+
+
+def repeat_single(cm, args):
+    """
+    args.count SINGLE captures at a fixed rate, then their timing statistics (in microseconds). Captures
+    of several instruments are repeated like RUN, without statistics
+    """
+    if len(args.address) > 1:
+        repeat(args, lambda index: single(cm, args, index))
+        return
+    metrics = cm.repeat_single_cmds(
+        channel_keys(args.channels), args.path, args.reinterpret, ProgressText(), args.count, args.interval,
+        on_capture=lambda index, timings: emit("saved", mode="single", index=index, path=args.path,
+                                               seconds=round(timings["total"], 3), **rounded(timings))
+    )
+    emit("stats", mode="single", header=metrics.header(), rows=metrics.rows())
+
+
+def run(cm, args, index, duration):
+    """
+    RUN for duration seconds, stopped early (and saved anyway) if hpctrl reports an error like the GUI does.
+    With several instruments, one reporting an error stops the RUN of all
+    """
+    temp_file = os.path.join(os.getenv("OSCI_MEASUREMENTS_DIR"), "temp.txt").replace("/", os.sep)
+    channels = channel_keys(args.channels)
+    emit("capture", mode="run", index=index, duration=duration)
+    started = time.time()
+    if len(args.address) == 1:
+        cm.start_run_cmds(temp_file, channels, args.path, args.preamble, args.reinterpret)
+    else:
+        cm.start_run_instruments_cmds(temp_file, args.address, channels, args.path, args.preamble, args.reinterpret)
+    failed = set()
+    while time.time() < started + duration and not failed:
+        for address in args.address:
+            timeout = min(RUN_POLL_INTERVAL / len(args.address), max(started + duration - time.time(), 0))
+            with cm.select(instrument(cm, args, address)):
+                output = cm.run_output(instrument_file(cm, args, temp_file, address), timeout)
+                if output is not None:
+                    if "!file written" in output:
+                        cm.get_adapter().put_back("!file written")
+                    emit("error", mode="run", index=index, address=address, output=output)
+                    failed.add(address)
+    if len(args.address) == 1:
+        savings = [cm.stop_run_cmds(temp_file, args.path, channels, args.preamble, args.reinterpret,
+                                    ProgressText(), ProgressText(), bool(failed))]
+    else:
+        savings = cm.stop_run_instruments_cmds(temp_file, args.address, args.path, channels, args.preamble,
+                                               args.reinterpret, ProgressText(), ProgressText(), failed)
+    for saving in savings:
+        saving.join()
+    for address in args.address:
+        file = instrument_file(cm, args, temp_file, address)
+        emit("flush", mode="run", index=index, address=address, **cm.flushes[file].timings())
+        if os.path.isfile(file):
+            emit("error", mode="run", index=index, address=address, output="hpctrl didn't write the measurements")
+        else:
+            emit("saved", mode="run", index=index, address=address, path=instrument_path(cm, args, address),
+                 seconds=round(time.time() - started, 3))
+
+
+def repeat(args, capture):
+    """
+    calls capture(index) args.count times, args.interval seconds from start to start
+    """
+    for index in range(args.count):
+        started = time.time()
+        capture(index)
+        if index + 1 < args.count:
+            time.sleep(max(started + args.interval - time.time(), 0))
+
+
+def serve(cm, args):
+    """
+    keeps the session and runs commands from stdin until exit or end of input
+    """
+    index = 0
+    for line in sys.stdin:
+        words = line.split()
+        if not words:
+            continue
+        command = words[0].lower()
+        try:
+            if command == "exit":
+                break
+            elif command == "single":
+                single(cm, args, index)
+                index += 1
+            elif command == "run":
+                run(cm, args, index, float(words[1]) if len(words) > 1 else args.duration)
+                index += 1
+            elif command == "config" and len(words) > 1:
+                on_each(cm, args, lambda address: apply_config(cm, words[1], words[2:], address))
+            elif command == "send" and len(words) > 1:
+                on_each(cm, args, lambda address: cm.CustomCmd(" ".join(words[1:])).do())
+                emit("sent", command=" ".join(words[1:]))
+            elif command == "query" and len(words) > 1:
+                answers = on_each(cm, args, lambda address: cm.CustomCmdWithOutput(" ".join(words[1:])).do())
+                for address, answer in zip(args.address, answers):
+                    emit("answer", address=address, command=" ".join(words[1:]), output=answer)
+            else:
+                emit("error", output=f"unknown command '{line.strip()}'")
+        except (cm.CommandError, cm.AdapterError, ValueError, OSError) as error:
+            emit("error", output=str(error))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Headless oscilloscope acquisition",
+                                     formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    parser.add_argument("--address", action="append", required=True,
+                        help="GPIB address of the oscilloscope (1-31), repeat it to measure with several at once")
+    parser.add_argument("--channels", type=channels_arg, default=["1"],
+                        help="comma-separated channels to measure, e.g. 1,3")
+    parser.add_argument("--config", help="config file to apply after connecting")
+    parser.add_argument("--input", action="append", default=[], help="value for the next # in the config")
+    parser.add_argument("--points", help="number of points")
+    parser.add_argument("--average", help="number of averaged measurements, turns averaging on")
+    parser.add_argument("--preamble", action="store_true", help="RUN saves a preamble with every measurement")
+    parser.add_argument("--no-reinterpret", dest="reinterpret", action="store_false",
+                        help="don't reinterpret trimmed data")
+    parser.add_argument("--path", help="folder for the measurements (OSCI_MEASUREMENTS_DIR by default)")
+    modes = parser.add_subparsers(dest="mode", required=True)
+    single_parser = modes.add_parser("single", help="repeated SINGLE captures")
+    run_parser = modes.add_parser("run", help="timed RUN captures")
+    serve_parser = modes.add_parser("serve", help="run commands from stdin on one session")
+    for mode_parser in (single_parser, run_parser):
+        mode_parser.add_argument("--count", type=int, default=1, help="number of captures")
+        mode_parser.add_argument("--interval", type=float, default=0, help="seconds from start to start of captures")
+    for mode_parser in (run_parser, serve_parser):
+        mode_parser.add_argument("--duration", type=float, default=10, help="seconds of every RUN")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not os.path.isfile(ENV_PATH):
+        sys.exit(f"{ENV_PATH} file not found")
+    load_dotenv(ENV_PATH)
+    args.channels = sorted(set(args.channels))
+    args.address = list(dict.fromkeys(args.address))
+    args.path = args.path or os.getenv("OSCI_MEASUREMENTS_DIR")
+    os.makedirs(args.path, exist_ok=True)
+
+    import backend.command as cm
+    if isinstance(cm.default_adapter(), cm.AdapterError):
+        emit("error", output=str(cm.default_adapter()))
+        sys.exit(1)
+    code = 0
+    try:
+        connect(cm, args)
+        if args.mode == "single":
+            repeat_single(cm, args)
+        elif args.mode == "run":
+            repeat(args, lambda index: run(cm, args, index, args.duration))
+        else:
+            serve(cm, args)
+    except (cm.CommandError, cm.AdapterError) as error:
+        emit("error", output=str(error))
+        code = 1
+    except KeyboardInterrupt:
+        emit("interrupted")
+        code = 1
+    finally:
+        for address in args.address:
+            with cm.select(instrument(cm, args, address)):
+                if cm.get_adapter().is_hpctrl_running():
+                    cm.disengage_cmd()
+    emit("done")
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    # measurements can be saved by worker processes, needed when frozen by PyInstaller
+    multiprocessing.freeze_support()
+    main()
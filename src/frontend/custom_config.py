@@ -158,7 +158,7 @@ Use '#' in a command for a variable input.
         if config_content:
             with open(os.path.join(os.getenv("OSCI_CONFIG_DIR"), file_name), "w") as f:
                 f.write(config_content)
-            self.gui.window[self.gui.config_file_combo].update(values=list(os.listdir(os.getenv("OSCI_CONFIG_DIR"))))
+            self.gui.update_config_files()
             
     def close_window(self):
         self.window.close()
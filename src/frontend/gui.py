@@ -1,3 +1,4 @@
+import asyncio
 import os
 import platform
 import PySimpleGUI as sg
@@ -5,6 +6,7 @@ import backend.command as cm
 import threading
 import time
 from backend.adapter import AdapterError
+from backend.async_adapter import EventLoopThread
 from frontend.custom_config import CustomConfig
 from frontend.terminal import Terminal
 from typing import List
@@ -44,13 +46,16 @@ class GUI:
     set_points_button = "set points"
     run_button = "RUN"
     single_button = "SINGLE"
+    single_finished = "single finished"
     new_config_button = "New cfg"
     edit_config_button = "Edit cfg"
     load_config_button = "Load cfg"
     curr_path = "curr path"
     config_file_combo = "cfg file"
     is_data_reinterpreted = True
-    checking_error_while_measuring_thread = None
+    checking_error_while_measuring = None
+    # waits during RUN (timer, check_if_running_measurement) run on this loop, it's started with the first RUN
+    event_loop = None
 
     # other stuff
     color_red = "maroon"
@@ -74,13 +79,27 @@ class GUI:
             finalize=True
         )
         self.button_activation(True)
+        self.update_config_files(select_first=True)
         self.check_adapter()
 
     def check_adapter(self):
-        if isinstance(cm.adapter, AdapterError):
-            sg.popup_no_border(cm.adapter, background_color=self.color_red)
+        adapter = cm.default_adapter()
+        if isinstance(adapter, AdapterError):
+            sg.popup_no_border(adapter, background_color=self.color_red)
             self.window.close()
 
+    def update_config_files(self, select_first=False):
+        """
+        lists the config directory into the config combo, it's done after the window is created
+        so the listing doesn't delay showing it
+        """
+        config_files = list(os.listdir(os.getenv("OSCI_CONFIG_DIR")))
+        if select_first:
+            self.window[self.config_file_combo].update(value=config_files[0] if config_files else "",
+                                                       values=config_files)
+        else:
+            self.window[self.config_file_combo].update(values=config_files)
+
     def _create_layout(self) -> List[List[sg.Frame]]:
         button_size = (10, 1)
         left_column_width = int(self.WIDTH * 1.8 / 5)
@@ -169,7 +188,6 @@ class GUI:
             element_justification="c"
         )
 
-        config_files = list(os.listdir(os.getenv("OSCI_CONFIG_DIR")))
         col_cfg = sg.Col(
             [
                 [
@@ -177,8 +195,7 @@ class GUI:
                     sg.Button(self.edit_config_button),
                     sg.Button(self.load_config_button),
                     sg.Combo(
-                        values=config_files,
-                        default_value=config_files[0] if config_files else "",
+                        values=[],
                         key=self.config_file_combo,
                         size=(15, 1)
                     ),
@@ -216,15 +233,18 @@ class GUI:
 
     def initialize_set_values(self):
         self._currently_set_values = {self.channels: []}
-        self.add_set_value_key(self.average_pts_input, cm.AverageNoCmd().get_set_value())
-        self.add_set_value_key(self.curr_points_input, cm.PointsCmd().get_set_value())
-        self.add_set_value_key(self.averaging_check, cm.AverageCmd().get_set_value())
+        average_pts, curr_points, averaging, *channels_enabled = cm.get_set_values([
+            cm.AverageNoCmd(), cm.PointsCmd(), cm.AverageCmd(),
+            *(cm.ChannelCmd(channel_number(channel)) for channel in self.channels_checkboxes)
+        ], refresh=True)
+        self.add_set_value_key(self.average_pts_input, average_pts)
+        self.add_set_value_key(self.curr_points_input, curr_points)
+        self.add_set_value_key(self.averaging_check, averaging)
         self.add_set_value_key(self.preamble_check, False)
         self.add_set_value_key(self.trimmed_check, True)
 
         self._currently_set_values[self.channels] = []
-        for channel in self.channels_checkboxes:
-            enabled = cm.ChannelCmd(channel_number(channel)).get_set_value()
+        for channel, enabled in zip(self.channels_checkboxes, channels_enabled):
             if enabled:
                 self._currently_set_values[self.channels].append(channel)
             self.window[channel].update(enabled)
@@ -261,27 +281,52 @@ class GUI:
         if answer == "Yes":
             self.set_gui_values_to_set_values()
 
-    def check_if_running_measurement(self):
-        output_timeout = 0.5
+    def get_event_loop(self):
+        if self.event_loop is None:
+            self.event_loop = EventLoopThread()
+        return self.event_loop
+
+    async def check_if_running_measurement(self, temp_file: str):
+        """
+        checks the output of hpctrl every output_interval seconds without blocking the loop, output during
+        RUN means an error (e.g. out of memory) and is sent as a RUN event
+        """
+        output_interval = 0.5
         while True:
             if self.window[self.run_button].get_text() == self.run_button:
                 return
-            curr_output = cm.GetOutput().do(timeout=output_timeout)
+            curr_output = cm.run_output(temp_file, timeout=0)
             if curr_output is not None:
                 if "!file written" in curr_output:
-                    cm.adapter.out_queue.put("!file written")
+                    cm.get_adapter().put_back("!file written")
                 self.window.write_event_value(self.run_button, curr_output)
                 return
-            time.sleep(output_timeout + 0.1)
+            await asyncio.sleep(output_interval)
 
-    def timer(self, start: float):
+    async def timer(self, start: float, temp_file: str):
         self.saving_text.update(visible=True)
+        ingest = cm.run_ingest(temp_file)
         while self.window[self.run_button].get_text() == "STOP":
             curr_time = round(time.time() - start, 1)
-            self.saving_text.update(value=f"Running {curr_time}s")
-            time.sleep(0.1)
-
-    def start_measurement(self, mismatched: str):
+            if ingest is not None:
+                self.saving_text.update(value=f"Running {curr_time}s, saved {ingest.saved}")
+            else:
+                self.saving_text.update(value=f"Running {curr_time}s")
+            await asyncio.sleep(0.1)
+
+    def single_measurement(self, channels: List[str], path: str):
+        """
+        runs SINGLE in a worker thread, so the window stays responsive, the error (or None) is sent back as an event
+        """
+        error = None
+        try:
+            cm.single_cmds(channels, path, self.is_data_reinterpreted, self.saving_text)
+        except Exception as e:
+            error = e
+        finally:
+            self.window.write_event_value(self.single_finished, error)
+
+    def start_measurement(self, mismatched: str, path: str):
         if mismatched:
             self.mismatched_popup(mismatched)
             return True
@@ -290,18 +335,17 @@ class GUI:
             sg.popup_no_border("No channels were selected", background_color=self.color_red)
             return True
         temp_file = convert_path(os.path.join(os.getenv("OSCI_MEASUREMENTS_DIR"), "temp.txt"))
-        cm.start_run_cmds(temp_file, channels)
+        cm.start_run_cmds(temp_file, channels, path, self.get_set_value(self.preamble_check), self.is_data_reinterpreted)
         self.window[self.run_button].Update("STOP")
         self.window[self.run_button].Update(button_color="red")
-        timer_thread = threading.Thread(target=self.timer, args=(time.time(),))
-        timer_thread.start()
-        self.checking_error_while_measuring_thread = threading.Thread(target=self.check_if_running_measurement, args=())
-        self.checking_error_while_measuring_thread.start()
+        event_loop = self.get_event_loop()
+        event_loop.submit(self.timer(time.time(), temp_file))
+        self.checking_error_while_measuring = event_loop.submit(self.check_if_running_measurement(temp_file))
 
     def stop_measurement(self, path: str, got_error: bool):
         self.window[self.run_button].Update(self.run_button)
-        if self.checking_error_while_measuring_thread is not None:
-            self.checking_error_while_measuring_thread.join()
+        if self.checking_error_while_measuring is not None:
+            self.checking_error_while_measuring.result()
         self.window[self.run_button].Update(button_color="#B9BBBE")
         self.saving_text.update(visible=True, value="Saving...")
         is_preamble = self.get_set_value(self.preamble_check)
@@ -400,17 +444,28 @@ class GUI:
             path = convert_path(values[self.curr_path])
             self.saving_text.update(visible=True, value="Saving...")
             if channels:
-                cm.single_cmds(channels, path, self.is_data_reinterpreted, self.saving_text)
+                self.button_activation(disable=True)
+                threading.Thread(target=self.single_measurement, args=(channels, path), daemon=True).start()
             else:
                 sg.popup_no_border("No channels were selected", background_color=self.color_red)
 
+        elif event == self.single_finished:
+            self.button_activation(disable=False)
+            self.saving_text.update(visible=False)
+            error = values[event]
+            if isinstance(error, (cm.CommandError, AdapterError)):
+                raise error
+            if error is not None:
+                sg.popup_no_border(f"SINGLE failed: {error}", background_color=self.color_red)
+
         elif event == self.run_button:
             button_text = self.window[self.run_button].get_text()
             if button_text == "STOP":  # stop measurement
                 self.button_activation(disable=False)
                 self.stop_measurement(convert_path(values[self.curr_path]), got_error=event in values)
             elif button_text == "RUN":  # start measurement
-                self.start_measurement(mismatched=self.get_mismatched_inputboxes(values))
+                self.start_measurement(mismatched=self.get_mismatched_inputboxes(values),
+                                       path=convert_path(values[self.curr_path]))
                 self.button_activation(disable=True)
                 self.window[self.run_button].update(disabled=False)
 
@@ -449,6 +504,8 @@ class GUI:
 
         if cm.adapter is not None and self.address in self._currently_set_values:
             cm.disengage_cmd()
+        if self.event_loop is not None:
+            self.event_loop.stop()
         self.window.close()
 
 
@@ -1,6 +1,7 @@
 import PySimpleGUI as sg
 import backend.command as cm
 from backend.adapter import AdapterError
+from backend.metrics import Metrics
 
 
 class Terminal:
@@ -51,6 +52,9 @@ class Terminal:
         if cmd_in.lower() in ("clr", "cls", "clear"):
             self.window[self.cmd_output].update("")
             return
+        if cmd_in_split[0] == "metrics":
+            self.metrics_command(cmd_in.split()[1:])
+            return
         if cmd_in_split[0] == "q":  # asking for output
             try:
                 output = cm.CustomCmdWithOutput(cmd_in).do()
@@ -69,3 +73,37 @@ class Terminal:
             except AdapterError as e:
                 sg.popup_no_border(e, background_color=self.gui.color_red)
 
+    def metrics_command(self, args):
+        """
+        metrics - shows command timings, metrics on/off - starts/stops collecting them,
+        metrics reset - forgets them, metrics json/csv <path> - exports them
+        """
+        adapter = cm.default_adapter()
+        action = args[0].lower() if args else "show"
+        if action == "on":
+            if adapter.metrics is None:
+                adapter.metrics = Metrics()
+            output = "collecting command timings"
+        elif action == "off":
+            adapter.metrics = None
+            output = "not collecting command timings"
+        elif adapter.metrics is None:
+            output = "command timings aren't collected, turn them on with 'metrics on' or OSCI_METRICS=true"
+        elif action == "show":
+            output = str(adapter.metrics)
+        elif action == "reset":
+            adapter.metrics.reset()
+            output = "command timings were reset"
+        elif action in ("json", "csv") and len(args) == 2:
+            try:
+                if action == "json":
+                    adapter.metrics.export_json(args[1])
+                else:
+                    adapter.metrics.export_csv(args[1])
+            except OSError as e:
+                sg.popup_no_border(e, background_color=self.gui.color_red)
+                return
+            output = f"command timings were exported to {args[1]}"
+        else:
+            output = "usage: metrics [on|off|reset|json <path>|csv <path>]"
+        self.window[self.cmd_output].update(value=output + "\n", append=True)
@@ -1,6 +1,6 @@
 import os
 import sys
-import PySimpleGUI as sg
+import multiprocessing
 from dotenv import load_dotenv
 
 ENV_PATH = ".env"
@@ -15,8 +15,11 @@ def make_dirs():
 
 
 if __name__ == "__main__":
+    # measurements can be saved by worker processes, needed when frozen by PyInstaller
+    multiprocessing.freeze_support()
     if not os.path.isfile(ENV_PATH):
         error_message = f"{ENV_PATH} file not found"
+        import PySimpleGUI as sg
         sg.PopupError(error_message)
         sys.exit(error_message)
     load_dotenv(ENV_PATH)
@@ -0,0 +1,16 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+
+@pytest.fixture
+def hpctrl_dir(monkeypatch):
+    """
+    adapters run the fake hpctrl of tools/fake_hpctrl with the default settings
+    """
+    monkeypatch.setenv("OSCI_HPCTRL_DIR", os.path.join(ROOT, "tools", "hpctrl"))
+    monkeypatch.delenv("OSCI_METRICS", raising=False)
+    monkeypatch.delenv("OSCI_READY_TIMEOUT", raising=False)
@@ -0,0 +1,103 @@
+import os
+import time
+import pytest
+from backend.adapter import Adapter, AdapterBase, AdapterError, OutputBuffer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_HPCTRL = os.path.join(ROOT, "tools", "fake_hpctrl", "hpctrl")
+IDN = "HEWLETT-PACKARD,83480A,US35240110,07.12"
+NOT_READY = b"!not ready, try again later\n"
+
+needs_fake = pytest.mark.skipif(not os.path.isfile(FAKE_HPCTRL), reason="fake hpctrl isn't built")
+
+
+@pytest.fixture
+def base(hpctrl_dir):
+    adapter = AdapterBase(True)
+    adapter.new_output()
+    return adapter
+
+
+def write(adapter, *messages):
+    for message in messages:
+        adapter.unconfirmed.append((message, time.perf_counter()))
+
+
+def test_rejections_are_counted():
+    output = OutputBuffer("!not ready")
+    output.feed(NOT_READY + b"answer\n" + NOT_READY)
+    assert output.rejections == 2
+    assert output.take(0, lines=1)[0] == b"answer\n"
+
+
+def test_take_until_not_ready_returns_early():
+    output = OutputBuffer("!not ready")
+    output.feed(NOT_READY)
+    started = time.monotonic()
+    assert output.take(1, lines=1, until_not_ready=True)[0] is None
+    assert output.take_block(1, until_not_ready=True) is None
+    assert time.monotonic() - started < 0.5
+
+
+def test_settle_matches_the_newest_messages(base):
+    write(base, "s one", "s two", "s three")
+    base.output.feed(NOT_READY * 2)
+    assert base.settle() == ["s two", "s three"]
+    assert not base.not_ready.is_set()
+    assert base.settle() == []
+
+
+def test_late_rejection_doubles_the_wait(base):
+    base.unconfirmed.append(("s one", time.perf_counter() - 2 * base.ready_timeout))
+    base.output.feed(NOT_READY)
+    ready_timeout = base.ready_timeout
+    assert base.settle() == ["s one"]
+    assert base.ready_timeout == 2 * ready_timeout
+
+
+def test_answer_settles_messages_before_the_query(base):
+    write(base, "s one", "s two", "q :acquire:points?")
+    base.awaited = "q :acquire:points?"
+    base.output.feed(NOT_READY + b"512\n")
+    assert base.answered() == ["s two"]
+    assert base.unconfirmed == []
+    assert base.awaited is None
+
+
+def test_unmatched_rejection_is_an_error(base):
+    base.output.feed(NOT_READY)
+    with pytest.raises(AdapterError):
+        base.settle()
+
+
+@needs_fake
+def test_queries_dont_wait_for_rejections(hpctrl_dir):
+    adapter = Adapter(True)
+    adapter.start_hpctrl()
+    try:
+        adapter.connect(7)
+        adapter.enter_cmd_mode()
+        started = time.perf_counter()
+        for _ in range(20):
+            assert adapter.send_and_get_output([adapter.cmd_idn], 1, lines=1) == IDN
+        assert time.perf_counter() - started < 20 * adapter.max_ready_timeout
+    finally:
+        adapter.kill_hpctrl()
+
+
+@needs_fake
+def test_rejected_commands_are_sent_again(hpctrl_dir, monkeypatch):
+    monkeypatch.setenv("FAKE_HPCTRL_DELAY", "100ms")
+    adapter = Adapter(True)
+    adapter.start_hpctrl()
+    try:
+        adapter.connect(7)
+        adapter.enter_cmd_mode()
+        adapter.send(["s :acquire:points 100"])
+        # lines read at once are a batch for the fake, the next ones come while it's busy
+        time.sleep(0.02)
+        adapter.send([f"s :acquire:points {points}" for points in (200, 300)])
+        assert adapter.send_and_get_output(["q :acquire:points?"], 2, lines=1) == "300"
+        assert adapter.output.rejections > 0
+    finally:
+        adapter.kill_hpctrl()
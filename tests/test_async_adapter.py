@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+from backend.adapter import AdapterError
+from backend.async_adapter import AsyncAdapter, EventLoopThread
+from test_adapter import IDN, needs_fake
+
+pytestmark = needs_fake
+
+
+async def connected():
+    adapter = AsyncAdapter(True)
+    await adapter.start_hpctrl()
+    await adapter.connect(7)
+    await adapter.enter_cmd_mode()
+    return adapter
+
+
+def test_query(hpctrl_dir):
+    async def main():
+        adapter = await connected()
+        try:
+            assert await adapter.is_osci_responsive()
+            assert await adapter.query("q *IDN?") == IDN
+        finally:
+            await adapter.kill_hpctrl()
+
+    asyncio.run(main())
+
+
+def test_rejected_commands_are_sent_again(hpctrl_dir, monkeypatch):
+    monkeypatch.setenv("FAKE_HPCTRL_DELAY", "100ms")
+
+    async def main():
+        adapter = await connected()
+        try:
+            await adapter.send(["s :acquire:points 100"])
+            # lines read at once are a batch for the fake, the next ones come while it's busy
+            await asyncio.sleep(0.02)
+            await adapter.send([f"s :acquire:points {points}" for points in (200, 300)])
+            assert await adapter.query("q :acquire:points?") == "300"
+            assert adapter.output.rejections > 0
+        finally:
+            await adapter.kill_hpctrl()
+
+    asyncio.run(main())
+
+
+def test_batch_and_block(hpctrl_dir):
+    async def main():
+        adapter = await connected()
+        try:
+            answers = await adapter.send_batch(["q *IDN?", "s :acquire:points 512", "q :acquire:points?"], 2)
+            assert answers == [IDN, "512"]
+            await adapter.send(["s :waveform:data?"])
+            block = await adapter.send_and_get_block(["b16"], 2)
+            assert len(block) == 2 * 12
+        finally:
+            await adapter.kill_hpctrl()
+
+    asyncio.run(main())
+
+
+def test_adapters_share_one_loop(hpctrl_dir):
+    loop = EventLoopThread()
+    try:
+        adapters = [loop.run(connected(), 5) for _ in range(2)]
+        queries = [loop.submit(adapter.query("q *IDN?")) for adapter in adapters]
+        assert [query.result(5) for query in queries] == [IDN, IDN]
+        for adapter in adapters:
+            loop.run(adapter.kill_hpctrl(), 5)
+    finally:
+        loop.stop()
+
+
+def test_timeout_raises(hpctrl_dir):
+    async def main():
+        adapter = await connected()
+        try:
+            with pytest.raises(AdapterError, match="timeout"):
+                await adapter.get_output(0.05, lines=1)
+        finally:
+            await adapter.kill_hpctrl()
+
+    asyncio.run(main())
@@ -0,0 +1,51 @@
+import pytest
+from backend.capture import CaptureError, CaptureFile
+
+RECORDS = [(b"p1", b"0 1 2 3"), (b"p2", b"15 -4 5"), (b"p3", b"31 0"), (b"p4", b"47 6 7 8 9")]
+
+
+def write_capture(tmp_path, lines_per_record, trailing_newline):
+    lines = [line for record in RECORDS for line in record[2 - lines_per_record:]]
+    path = tmp_path / "temp.txt"
+    path.write_bytes(b"\n".join(lines) + (b"\n" if trailing_newline else b""))
+    return str(path)
+
+
+@pytest.mark.parametrize("trailing_newline", [True, False])
+@pytest.mark.parametrize("lines_per_record", [1, 2])
+def test_records_round_trip(tmp_path, lines_per_record, trailing_newline):
+    path = write_capture(tmp_path, lines_per_record, trailing_newline)
+    with CaptureFile(path, "23", lines_per_record) as capture:
+        assert len(capture) == len(RECORDS)
+        for i, (preamble, data) in enumerate(RECORDS):
+            assert capture.record(i) == (preamble if lines_per_record == 2 else None, data)
+            assert capture.channel(i) == "23"[i % 2]
+            assert capture.timestamp(i) == int(data.split()[0])
+        with pytest.raises(IndexError):
+            capture.record(len(RECORDS))
+
+
+def test_scan_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(CaptureFile, "scan_size", 3)
+    with CaptureFile(write_capture(tmp_path, 2, True), "1", 2) as capture:
+        assert [capture.record(i) for i in range(len(capture))] == RECORDS
+
+
+def test_incomplete_record_is_left_out(tmp_path):
+    path = tmp_path / "temp.txt"
+    path.write_bytes(b"p1\n0 1 2\np2\n")
+    with CaptureFile(str(path), "1", 2) as capture:
+        assert len(capture) == 1
+        assert capture.record(0) == (b"p1", b"0 1 2")
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "temp.txt"
+    path.write_bytes(b"")
+    with CaptureFile(str(path), "1") as capture:
+        assert len(capture) == 0
+
+
+def test_no_channels(tmp_path):
+    with pytest.raises(CaptureError):
+        CaptureFile(write_capture(tmp_path, 1, True), "")
@@ -0,0 +1,24 @@
+import time
+import pytest
+import backend.command as cm
+
+
+def test_run_doesnt_start_with_bad_save_options(monkeypatch, tmp_path):
+    monkeypatch.setenv("OSCI_OUTPUT_FORMAT", "docx")
+    monkeypatch.setattr(cm, "get_adapter", lambda: pytest.fail("a command was sent"))
+    with pytest.raises(cm.CommandError, match="OSCI_OUTPUT_FORMAT"):
+        cm.start_run_cmds(str(tmp_path / "temp.txt"), ["ch1"], str(tmp_path))
+
+
+def test_lag_of_captures_behind_schedule_doesnt_add_up(monkeypatch):
+    def single_cmds(channels, path, reinterpret_trimmed_data, saving_gui_text):
+        time.sleep(0.05)
+        return {"total": 0.05}
+
+    monkeypatch.setattr(cm, "single_cmds", single_cmds)
+    lags = []
+    cm.repeat_single_cmds(["ch1"], None, True, None, 4, 0.02,
+                          on_capture=lambda index, timings: lags.append(timings["lag"]))
+    assert lags[0] < 0.01
+    for lag in lags[1:]:
+        assert 0.02 <= lag < 0.05
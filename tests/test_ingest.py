@@ -0,0 +1,61 @@
+import random
+from types import SimpleNamespace
+import pytest
+from backend.ingest import RunIngest
+
+
+class Ingest(RunIngest):
+    # complete_end is called by the tests only
+    poll_interval = 3600
+    chunk_size = 7
+
+
+def old_complete_end(data, lines_per_record):
+    end = data.rfind(b"\n") + 1
+    for _ in range(data.count(b"\n") % lines_per_record):
+        end = data.rfind(b"\n", 0, end - 1) + 1
+    return end
+
+
+@pytest.fixture
+def ingest(tmp_path):
+    def make(lines_per_record):
+        file_path = tmp_path / "temp.txt"
+        file_path.write_bytes(b"")
+        measurements = SimpleNamespace(file_path=str(file_path), lines_per_measurement=lines_per_record)
+        made = Ingest(measurements, str(tmp_path / "saved"))
+        made.stopped.set()
+        return made, file_path
+    return make
+
+
+@pytest.mark.parametrize("lines_per_record", [1, 2])
+def test_complete_end_while_the_file_grows(ingest, lines_per_record):
+    made, file_path = ingest(lines_per_record)
+    random.seed(lines_per_record)
+    data = b""
+    for _ in range(200):
+        data += b"".join(random.choice([b"1", b"23", b",", b"\n"]) for _ in range(random.randint(0, 30)))
+        file_path.write_bytes(data)
+        assert made.complete_end() == old_complete_end(data, lines_per_record)
+
+
+def test_complete_end_after_the_offset_moves(ingest):
+    made, file_path = ingest(2)
+    file_path.write_bytes(b"p1\nd1\np2\nd2\np3\n")
+    assert made.complete_end() == 12
+    made.offset = 6
+    assert made.complete_end() == 12
+    made.offset = 12
+    file_path.write_bytes(b"p1\nd1\np2\nd2\np3\nd3\n")
+    assert made.complete_end() == 18
+
+
+def test_complete_end_of_a_file_written_again(ingest):
+    made, file_path = ingest(1)
+    file_path.write_bytes(b"first\nsecond\n")
+    assert made.complete_end() == 13
+    made.offset = 13
+    file_path.write_bytes(b"new\n")
+    assert made.complete_end() == 4
+    assert made.offset == 0
@@ -0,0 +1,91 @@
+import os
+import numpy as np
+import pytest
+from backend.measurement import LazyMeasurement, Measurement, parse_words
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PREAMBLE = ("2,2,100,100,1.00000000E-10,2.2000000000E-08,0,1.32375E-06,1.33434E-03,0,2,1.00000E-08,"
+            "2.2000000000E-08,8.00000E-02,0.0E+000,\"13 DEC 2021\",\"08:08:21:21\",\"83480A:US35240110\","
+            "\"83485A:US34430174\",2,100,2,1,2.00000E+10,0E+000")
+# clipped high, clipped low, hole, the limits of int16 and the valid range
+SPECIAL = "32256 31744 31232 -32768 32767 30720 -32736 0 -1 1"
+
+
+def old_correct_data(preamble, data, reinterpret_trimmed_data):
+    """
+    the per-sample loop Measurement.correct_data was before it used numpy
+    """
+    fields = preamble.split(",")
+    y_increment, y_origin = fields[7], fields[8]
+    _data = []
+    for i in data.split():
+        word_value = int(i)
+        if reinterpret_trimmed_data:
+            if word_value == 32256:
+                word_value = 30720
+            elif word_value == 31744:
+                word_value = -32736
+            elif word_value == 31232:
+                word_value = "HOLE"
+        if word_value != "HOLE":
+            word_value = word_value * float(y_increment) + float(y_origin)
+        _data.append(word_value)
+    return _data
+
+
+def pon_records():
+    with open(os.path.join(ROOT, "tools", "fake_hpctrl", "pon.txt")) as f:
+        lines = f.read().splitlines()
+    # a preamble line and a line of the us stamp and the words
+    return [(lines[i], lines[i + 1].split(" ", 1)[1]) for i in range(0, len(lines) - 1, 2)]
+
+
+def cases():
+    records = pon_records() + [(PREAMBLE, SPECIAL), (PREAMBLE, "")]
+    return [(preamble, data, reinterpret) for preamble, data in records for reinterpret in (True, False)]
+
+
+def decoded(measurement):
+    return [
+        "HOLE" if hole else value
+        for value, hole in zip(measurement.data.tolist(), measurement.holes.tolist())
+    ]
+
+
+def data_lines(measurement):
+    return str(measurement).split("\n\n", 1)[1].splitlines()
+
+
+@pytest.mark.parametrize("cls", [Measurement, LazyMeasurement])
+@pytest.mark.parametrize("preamble, data, reinterpret", cases())
+def test_decoding_matches_the_per_sample_loop(cls, preamble, data, reinterpret):
+    expected = old_correct_data(preamble, data, reinterpret)
+    for raw in (data, data.encode()):
+        measurement = cls(preamble, raw, "1", reinterpret)
+        assert len(measurement) == len(expected)
+        assert decoded(measurement) == expected
+        assert data_lines(measurement) == [str(value) for value in expected]
+
+
+def test_holes_are_nan_only_when_reinterpreted():
+    reinterpreted = Measurement(PREAMBLE, SPECIAL, "1", True)
+    assert reinterpreted.holes.tolist() == [False, False, True] + [False] * 7
+    assert np.isnan(reinterpreted.data[2])
+    kept = Measurement(PREAMBLE, SPECIAL, "1", False)
+    assert not kept.holes.any()
+    assert not np.isnan(kept.data).any()
+
+
+@pytest.mark.parametrize("data", ["1 70000 2", "-32769", "1 99999999999999999999"])
+def test_words_out_of_range_raise(data):
+    with pytest.raises(ValueError, match="16 bits"):
+        parse_words(data)
+    with pytest.raises(ValueError):
+        Measurement(PREAMBLE, data, "1", True)
+    with pytest.raises(ValueError):
+        LazyMeasurement(PREAMBLE, data, "1", True).data
+
+
+def test_words_that_arent_numbers_raise():
+    with pytest.raises(ValueError):
+        parse_words("1 x 2")
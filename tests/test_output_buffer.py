@@ -0,0 +1,131 @@
+import pytest
+from backend.adapter import OutputBuffer
+
+NOT_READY = "!not ready"
+BLOCK = b"#16" + bytes([1, 2, 10, 35, 33, 4])  # contains b"\n#!" in its data
+
+
+def buffer():
+    return OutputBuffer(NOT_READY)
+
+
+def feed_split(output, data, at):
+    output.feed(data[:at])
+    output.feed(data[at:])
+
+
+def all_splits(data):
+    return pytest.mark.parametrize("at", range(len(data) + 1))
+
+
+RESPONSE = b"12\n6441\n8921\n"
+
+
+@all_splits(RESPONSE)
+def test_lines_split_anywhere(at):
+    output = buffer()
+    feed_split(output, RESPONSE, at)
+    assert output.take(0, lines=1)[0] == b"12\n"
+    assert output.take(0, lines=2)[0] == b"6441\n8921\n"
+    assert output.take(0, lines=1)[0] is None
+
+
+def test_incomplete_line_is_not_taken():
+    output = buffer()
+    output.feed(b"644")
+    assert output.take(0, lines=1)[0] is None
+    output.feed(b"1\n")
+    assert output.take(0, lines=1)[0] == b"6441\n"
+
+
+BLOCK_THEN_TEXT = BLOCK + b"\nanswer\n"
+
+
+@all_splits(BLOCK_THEN_TEXT)
+def test_block_followed_by_text(at):
+    output = buffer()
+    feed_split(output, BLOCK_THEN_TEXT, at)
+    assert output.take_block(0) == BLOCK[3:]
+    assert output.take(0, lines=1)[0] == b"answer\n"
+    assert output.take_block(0) is None
+
+
+def test_partial_block_waits_for_the_rest():
+    output = buffer()
+    output.feed(BLOCK[:5])
+    assert output.take_block(0) is None
+    assert output.take(0, lines=1)[0] is None
+    output.feed(BLOCK[5:])
+    assert output.take_block(0) == BLOCK[3:]
+
+
+def test_text_after_block_newline_is_kept():
+    output = buffer()
+    output.feed(BLOCK + b"\n\n")
+    assert output.take_block(0) == BLOCK[3:]
+    assert output.take(0, lines=1)[0] == b"\n"
+
+
+def test_hash_line_that_is_not_a_block_is_text():
+    output = buffer()
+    output.feed(b"#x not a block\n")
+    assert output.take(0, lines=1)[0] == b"#x not a block\n"
+    assert output.take_block(0) is None
+
+
+NOT_READY_BETWEEN = b"ok\n!not ready, try again later\nanswer\n"
+
+
+@all_splits(NOT_READY_BETWEEN)
+def test_not_ready_split_anywhere(at):
+    output = buffer()
+    feed_split(output, NOT_READY_BETWEEN, at)
+    assert output.not_ready.is_set()
+    assert output.take(0, lines=2)[0] == b"ok\nanswer\n"
+
+
+def test_partial_not_ready_doesnt_set_the_flag():
+    output = buffer()
+    output.feed(b"!not re")
+    assert not output.not_ready.is_set()
+    output.feed(b"ady, try again later\n")
+    assert output.not_ready.is_set()
+    assert output.take(0, lines=1)[0] is None
+
+
+def test_put_back_comes_first():
+    output = buffer()
+    output.feed(b"later\n")
+    output.put_back(b"!file written")
+    assert output.take(0, terminator="!file written")[0] == b"!file written\n"
+    assert output.take(0, lines=1)[0] == b"later\n"
+
+
+def test_terminator_framing():
+    output = buffer()
+    output.feed(b"First big error\nSecond big error\n!file wri")
+    assert output.take(0, terminator="!file written")[0] is None
+    output.feed(b"tten\nnext\n")
+    assert output.take(0, terminator="!file written")[0] == b"First big error\nSecond big error\n!file written\n"
+    assert output.take(0, lines=1)[0] == b"next\n"
+
+
+def test_idle_framing_takes_everything_after_the_gap():
+    output = buffer()
+    output.feed(b"a\nb\n")
+    assert output.take(1, idle=0.01)[0] == b"a\nb\n"
+
+
+def test_take_returns_none_when_closed():
+    output = buffer()
+    output.close()
+    assert output.take(1, lines=1)[0] is None
+    assert output.take_block(1) is None
+
+
+def test_clear():
+    output = buffer()
+    output.feed(b"text\n" + BLOCK)
+    output.clear()
+    assert output.take(0, lines=1)[0] is None
+    assert output.take_block(0) is None
@@ -0,0 +1,63 @@
+import os
+import pytest
+from test_adapter import IDN, ROOT, needs_fake
+
+ADDRESSES = ["7", "8"]
+
+pytestmark = needs_fake
+
+
+class Text:
+    """
+    stands for the saving text and run button of the GUI
+    """
+
+    def update(self, value=None, **kwargs):
+        pass
+
+    def Update(self, *args, **kwargs):
+        pass
+
+
+@pytest.fixture
+def cm(monkeypatch):
+    # the fake reads its measurement files relative to the root folder
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setenv("OSCI_HPCTRL_DIR", os.path.join(ROOT, "tools", "hpctrl"))
+    for name in ("OSCI_METRICS", "OSCI_READY_TIMEOUT", "OSCI_RUN_INGEST", "OSCI_RING_SECONDS", "OSCI_ARCHIVE",
+                 "OSCI_BINARY_TRANSFER", "FAKE_HPCTRL_DELAY", "FAKE_HPCTRL_PROGRESSIVE"):
+        monkeypatch.delenv(name, raising=False)
+    import backend.command as cm
+    cm.initialize_instruments_cmds(ADDRESSES)
+    yield cm
+    cm.disengage_instruments_cmd(ADDRESSES)
+
+
+def test_every_instrument_has_its_own_hpctrl(cm):
+    instruments = [cm.pool.get(address) for address in ADDRESSES]
+    assert instruments[0].adapter is not instruments[1].adapter
+    assert all(instrument.adapter.is_hpctrl_running() for instrument in instruments)
+    answers = cm.pool.run_each(ADDRESSES, lambda instrument: cm.CustomCmdWithOutput("q *IDN?").do())
+    assert answers == [IDN, IDN]
+
+
+def test_single_saves_into_a_folder_of_every_instrument(cm, tmp_path):
+    timings = cm.single_instruments_cmds(ADDRESSES, ["ch1", "ch3"], str(tmp_path), True, Text())
+    assert len(timings) == len(ADDRESSES)
+    for address in ADDRESSES:
+        names = sorted(os.listdir(tmp_path / f"gpib{address}"))
+        assert [name[-7:] for name in names] == ["ch1.txt", "ch3.txt"]
+
+
+def test_run_returns_the_saving_thread_of_every_instrument(cm, tmp_path):
+    temp_file = str(tmp_path / "temp.txt")
+    cm.start_run_instruments_cmds(temp_file, ADDRESSES, ["ch1"], str(tmp_path))
+    savings = cm.stop_run_instruments_cmds(temp_file, ADDRESSES, str(tmp_path), ["ch1"], False, True,
+                                           Text(), Text(), False)
+    assert len(savings) == len(ADDRESSES)
+    for saving in savings:
+        saving.join(30)
+        assert not saving.is_alive()
+    for address in ADDRESSES:
+        assert not os.path.exists(tmp_path / f"temp_gpib{address}.txt")
+        assert os.listdir(tmp_path / f"gpib{address}")
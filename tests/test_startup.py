@@ -0,0 +1,52 @@
+import importlib.util
+import os
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_check():
+    spec = importlib.util.spec_from_file_location(
+        "check_startup_time", os.path.join(ROOT, "scripts", "check_startup_time.py")
+    )
+    check = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(check)
+    return check
+
+
+check = load_check()
+
+
+def import_module(module):
+    """
+    returns the budget of the module and the fastest of its imports in fresh interpreters
+    """
+    budget, forbidden = check.BUDGETS[module]
+    return budget, check.measure(module, forbidden, repeat=3)[0]
+
+
+@pytest.fixture(scope="module")
+def command_import():
+    return import_module("backend.command")
+
+
+def test_command_import_is_within_budget(command_import):
+    budget, result = command_import
+    assert result["ms"] <= budget
+
+
+def test_command_import_doesnt_load_numpy_or_saving(command_import):
+    assert command_import[1]["loaded"] == []
+
+
+def test_command_import_doesnt_create_the_adapter(command_import):
+    assert not command_import[1]["adapter_created"]
+
+
+def test_gui_import():
+    if importlib.util.find_spec("PySimpleGUI") is None:
+        pytest.skip("PySimpleGUI isn't installed")
+    budget, result = import_module("frontend.gui")
+    assert result["loaded"] == []
+    assert not result["adapter_created"]
+    assert result["ms"] <= budget
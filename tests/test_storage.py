@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+from backend.measurement import Measurement
+from backend.storage import (
+    ARCHIVE_FOOTER, COMPRESSION_GZIP, ArchiveReader, ArchiveWriter, StorageError, compress, encode_measurement,
+    encode_record, load_record,
+)
+from test_measurement import PREAMBLE, SPECIAL
+
+SAMPLES = {
+    "int16": np.array([0, 1, -1, 32767, -32768, 31232], dtype=np.int16),
+    "float32": np.array([0.0, 1.5, -2.25, np.nan, 3.4e38], dtype=np.float32),
+}
+HEADER = {"channel": "2", "us": 1234}
+
+
+def write_record(tmp_path, sample_format, samples, compressed):
+    record = encode_record(HEADER, samples, sample_format)
+    path = tmp_path / "record.bin"
+    path.write_bytes(compress(record, COMPRESSION_GZIP, 6) if compressed else record)
+    return str(path)
+
+
+@pytest.mark.parametrize("sample_format", ["int16", "float32"])
+@pytest.mark.parametrize("compressed, mmap", [(False, True), (False, False), (True, True)])
+def test_record_round_trip(tmp_path, sample_format, compressed, mmap):
+    samples = SAMPLES[sample_format]
+    header, loaded = load_record(write_record(tmp_path, sample_format, samples, compressed), mmap)
+    assert header == dict(HEADER, sample_format=sample_format, samples=len(samples))
+    assert loaded.dtype == samples.dtype
+    np.testing.assert_array_equal(loaded, samples)
+    assert isinstance(loaded, np.memmap) == (mmap and not compressed)
+
+
+@pytest.mark.parametrize("sample_format", ["int16", "float32"])
+def test_empty_record_round_trip(tmp_path, sample_format):
+    header, loaded = load_record(write_record(tmp_path, sample_format, SAMPLES[sample_format][:0], False))
+    assert header["samples"] == 0
+    assert len(loaded) == 0
+
+
+def test_measurement_round_trip(tmp_path):
+    measurement = Measurement(PREAMBLE, SPECIAL, "1", True)
+    path = tmp_path / "measurement.bin"
+    for sample_format, expected in (("int16", measurement.words), ("float32", measurement.data)):
+        path.write_bytes(encode_measurement(measurement, sample_format))
+        header, loaded = load_record(str(path), mmap=False)
+        assert header["channel"] == "1"
+        assert header["y_increment"] == measurement.preamble.y_increment
+        np.testing.assert_array_equal(loaded, expected.astype(loaded.dtype))
+
+
+def write_archive(path, records):
+    with ArchiveWriter(str(path), "int16") as writer:
+        for record, channel, us in records:
+            writer.append(record, channel, us)
+
+
+def archive_records():
+    return [
+        (encode_record(dict(HEADER, channel=channel), SAMPLES["int16"][:i], "int16"), channel, us)
+        for i, (channel, us) in enumerate([("1", 0), ("2", 10), ("1", None), ("4", 30)])
+    ]
+
+
+def check_archive(path, records):
+    with ArchiveReader(str(path)) as reader:
+        assert reader.record_format == "int16"
+        assert len(reader) == len(records)
+        for i, (record, channel, us) in enumerate(records):
+            assert reader.record(i) == record
+            assert reader.channel(i) == channel
+            assert reader.us(i) == (-1 if us is None else us)
+            header, samples = reader.load(i)
+            assert header["channel"] == channel
+            np.testing.assert_array_equal(samples, SAMPLES["int16"][:i])
+
+
+def test_archive_round_trip(tmp_path):
+    records = archive_records()
+    write_archive(tmp_path / "run.osca", records)
+    check_archive(tmp_path / "run.osca", records)
+
+
+def test_archive_without_footer_is_scanned(tmp_path):
+    records = archive_records()
+    path = tmp_path / "run.osca"
+    write_archive(path, records)
+    data = path.read_bytes()
+    index_offset = ARCHIVE_FOOTER.unpack(data[-ARCHIVE_FOOTER.size:])[0]
+    # an archive of a run that didn't end properly, the last record was being written
+    path.write_bytes(data[:index_offset - 5])
+    check_archive(path, records[:-1])
+    path.write_bytes(data[:index_offset])
+    check_archive(path, records)
+
+
+def test_compressed_archive_records(tmp_path):
+    record = encode_record(HEADER, SAMPLES["int16"], "int16")
+    path = tmp_path / "run.osca"
+    with ArchiveWriter(str(path), "int16") as writer:
+        writer.append(compress(record, COMPRESSION_GZIP, 6), "2", 5)
+    with ArchiveReader(str(path)) as reader:
+        assert reader.record(0) == record
+
+
+def test_not_an_archive(tmp_path):
+    path = tmp_path / "record.bin"
+    path.write_bytes(encode_record(HEADER, SAMPLES["int16"], "int16"))
+    with pytest.raises(StorageError):
+        ArchiveReader(str(path))
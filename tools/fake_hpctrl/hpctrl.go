@@ -2,6 +2,7 @@ package main
 
 import (
 	"bufio"
+	"encoding/binary"
 	"errors"
 	"flag"
 	"fmt"
@@ -13,6 +14,7 @@ import (
 	"regexp"
 	"strconv"
 	"strings"
+	"sync/atomic"
 	"time"
 	"unicode"
 )
@@ -28,6 +30,7 @@ const (
 	responseIdn            = "HEWLETT-PACKARD,83480A,US35240110,07.12"
 	cmdData                = "16"
 	responseData           = "1776\n6441\n8921\n12026\n16171\n18826\n20363\n20797\n19499\n17190\n32256\n31744\n31232"
+	cmdDataBlock           = "b16"
 	cmdGetPreamble         = "q :waveform:preamble?"
 	responsePreamble       = "2,2,2000,50,5.000000E-12,2.2000000000E-08,0,1.32375E-06,1.33434E-03,0,2,1.00000E-08,2.2000000000E-08,8.00000E-02,0.0E+000,\"10 DEC 2021\",\"14:16:16:16\",\"83480A:US35240110\",\"83485A:US34430174\",2,100,2,1,2.00000E+10,0E+000"
 	cmdFile                = "file"
@@ -43,7 +46,11 @@ const (
 	cmAverageOn            = "s :acquire:average on"
 	cmAverageOff           = "s :acquire:average off"
 	delayBetweenCommands   = 200 * time.Microsecond
+	delayEnv               = "FAKE_HPCTRL_DELAY"
+	progressiveEnv         = "FAKE_HPCTRL_PROGRESSIVE"
 	msgFileWritten         = "!file written"
+	msgNotReady            = "!not ready, try again later"
+	cmdConnect             = "connect"
 )
 
 var (
@@ -60,6 +67,62 @@ type internalData struct {
 	isPreamble          bool
 	isAverage           bool
 	enabledChannels     map[int]struct{}
+	// GPIB address from CONNECT, several fake hpctrls can run at once for different addresses
+	address string
+}
+
+// returns the file the measurement file is copied from
+func (data internalData) fileWithData() string {
+	if data.isPreamble {
+		return fileWithPon
+	}
+	if data.isAverage {
+		return fileWithPoff
+	}
+	return fileWithPoff1000
+}
+
+// appends records to the measurement file one by one during a continuous read, like a target
+// that exposes records progressively
+type progressiveWriter struct {
+	stop chan struct{}
+	done chan struct{}
+}
+
+// starts writing records (linesPerRecord lines of source) into destination, one every interval
+func startProgressiveWriter(destination, source string, linesPerRecord int, interval time.Duration) *progressiveWriter {
+	content, err := os.ReadFile(source)
+	exitIfErr(err)
+	lines := strings.SplitAfter(string(content), string(newLineChar))
+	dst, err := os.Create(destination)
+	exitIfErr(err)
+	w := &progressiveWriter{stop: make(chan struct{}), done: make(chan struct{})}
+	go func() {
+		defer close(w.done)
+		defer dst.Close()
+		written := 0
+		for written < len(lines) {
+			select {
+			case <-w.stop:
+				_, err := dst.WriteString(strings.Join(lines[written:], ""))
+				exitIfErr(err)
+				return
+			case <-time.After(interval):
+				end := min(written+linesPerRecord, len(lines))
+				_, err := dst.WriteString(strings.Join(lines[written:end], ""))
+				exitIfErr(err)
+				written = end
+			}
+		}
+		<-w.stop
+	}()
+	return w
+}
+
+// writes the rest of the records and waits until they're written
+func (w *progressiveWriter) finish() {
+	close(w.stop)
+	<-w.done
 }
 
 func newInternalData() internalData {
@@ -84,7 +147,13 @@ func main() {
 	defer logFile.Close()
 	writeToFile(logFile, []byte(fmt.Sprintf("started at %v\n", time.Now())))
 
-	reader := bufio.NewReader(os.Stdin)
+	var busy atomic.Bool
+	inputs := make(chan []byte)
+	go readInputs(bufio.NewReader(os.Stdin), inputs, &busy)
+
+	delay := getDelay()
+	recordInterval := getProgressiveInterval()
+	var progressive *progressiveWriter
 
 	data := newInternalData()
 
@@ -94,31 +163,30 @@ func main() {
 		if data.measurementFilePath == "" {
 			log.Fatalln("measurementFile is empty")
 		}
-		var fileWithData string
-		if data.isPreamble {
-			fileWithData = fileWithPon
+		if progressive != nil {
+			progressive.finish()
+			progressive = nil
 		} else {
-			if data.isAverage {
-				fileWithData = fileWithPoff
-			} else {
-				fileWithData = fileWithPoff1000
-			}
+			copyFile(data.measurementFilePath, data.fileWithData())
 		}
-		copyFile(data.measurementFilePath, fileWithData)
 		fmt.Println(msgFileWritten)
 	}
 
 loop:
-	for {
-		input, err := reader.ReadBytes(endOfLineChar)
-		exitIfErr(err)
-
+	for input := range inputs {
 		// simulating delay
-		time.Sleep(delayBetweenCommands)
-
-		writeToFile(logFile, input)
+		time.Sleep(delay)
 
 		trimmedInput := strings.TrimSpace(strings.ToLower(string(input)))
+		if strings.HasPrefix(trimmedInput, cmdConnect+" ") {
+			data.address = strings.TrimSpace(strings.TrimPrefix(trimmedInput, cmdConnect))
+		}
+
+		if data.address != "" {
+			writeToFile(logFile, append([]byte("gpib"+data.address+": "), input...))
+		} else {
+			writeToFile(logFile, input)
+		}
 
 		switch trimmedInput {
 		case cmdExit:
@@ -127,6 +195,8 @@ loop:
 			fmt.Println(responseIdn)
 		case cmdData:
 			fmt.Println(responseData)
+		case cmdDataBlock:
+			writeDataBlock(responseData)
 		case cmdGetPreamble:
 			fmt.Println(responsePreamble)
 		case cmdPreambleOn:
@@ -142,6 +212,13 @@ loop:
 		case cmAverageOff:
 			data.isAverage = false
 		case cmdStartContinuousRead:
+			if recordInterval > 0 {
+				linesPerRecord := 1
+				if data.isPreamble {
+					linesPerRecord = 2
+				}
+				progressive = startProgressiveWriter(data.measurementFilePath, data.fileWithData(), linesPerRecord, recordInterval)
+			}
 			if rand.Intn(3) == 0 {
 				time.Sleep(1 * time.Second)
 				fmt.Println("First big error\nSecond big error")
@@ -176,11 +253,70 @@ loop:
 				fmt.Println("0")
 			}
 		}
+		busy.Store(false)
 	}
 
 	writeToFile(logFile, []byte{newLineChar})
 }
 
+// writes the data (without the count on the first line) as little-endian 16-bit words
+// in an IEEE 488.2 definite length block: #<number of digits><length><bytes>
+func writeDataBlock(data string) {
+	words := strings.Fields(data)[1:]
+	block := make([]byte, 2*len(words))
+	for i, word := range words {
+		value, err := strconv.Atoi(word)
+		exitIfErr(err)
+		binary.LittleEndian.PutUint16(block[2*i:], uint16(int16(value)))
+	}
+	length := strconv.Itoa(len(block))
+	out := bufio.NewWriter(os.Stdout)
+	fmt.Fprintf(out, "#%d%s", len(length), length)
+	out.Write(block)
+	out.WriteByte(newLineChar)
+	exitIfErr(out.Flush())
+}
+
+// reads lines from stdin as soon as they come, commands that come while the previous one
+// is processed are rejected like by hpctrl. Lines written at once with an accepted command
+// (already buffered) are a batch and are all processed
+func readInputs(reader *bufio.Reader, inputs chan<- []byte, busy *atomic.Bool) {
+	inBatch := false
+	for {
+		line, err := reader.ReadBytes(endOfLineChar)
+		exitIfErr(err)
+		if !busy.CompareAndSwap(false, true) && !inBatch {
+			fmt.Println(msgNotReady)
+			continue
+		}
+		inBatch = reader.Buffered() > 0
+		inputs <- line
+	}
+}
+
+// returns the time it takes to process a command, can be set with FAKE_HPCTRL_DELAY (e.g. 100ms)
+func getDelay() time.Duration {
+	value, ok := os.LookupEnv(delayEnv)
+	if !ok {
+		return delayBetweenCommands
+	}
+	delay, err := time.ParseDuration(value)
+	exitIfErr(err)
+	return delay
+}
+
+// returns the time between records written progressively during a continuous read,
+// set by FAKE_HPCTRL_PROGRESSIVE (e.g. 50ms), 0 (the file is written at once) if it isn't set
+func getProgressiveInterval() time.Duration {
+	value, ok := os.LookupEnv(progressiveEnv)
+	if !ok {
+		return 0
+	}
+	interval, err := time.ParseDuration(value)
+	exitIfErr(err)
+	return interval
+}
+
 func writeToFile(f *os.File, msg []byte) {
 	_, err := f.Write(msg)
 	exitIfErr(err)